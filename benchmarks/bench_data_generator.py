@@ -0,0 +1,245 @@
+"""
+Stage-level benchmarks of src/data_generator, they run offline:
+sampling stages use the bundled OSM fixture (benchmarks/fixtures/osm_fixture.json),
+drawing and annotation stages use the checked-in data/ samples.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_data_generator [--repeats 50] [--output results.json]
+                                              [--compare old_results.json]
+
+Results are written as json: timings of every stage and, for every graph size,
+samples per second and peak memory of the whole per-sample pipeline.
+"""
+from src.data_generator.osm_cache import extract_from_response_file
+from src.data_generator.osm_index import SpatialIndex, SegmentIndex
+from src.data_generator.osm_sampler import get_nodes_in_neighbourhood, \
+    create_adj_list
+from src.data_generator.connectivity import is_connected
+from src.data_generator.visualize import draw_graph, \
+    obtain_node_bboxes, \
+    obtain_edge_bboxes
+from src.data_generator.writers import Sample, FileWriter, ShardWriter
+from src.data_generator.graph import Graph
+from src.data_generator.util import png_size
+from collections import defaultdict, deque
+from typing import Callable, Optional
+import statistics
+import tempfile
+import tracemalloc
+import argparse
+import platform
+import resource
+import random
+import pickle
+import time
+import json
+import glob
+import os
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "osm_fixture.json")
+SAMPLES_DIR = "data"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+GRAPH_SIZES = (6, 13, 50, 200)
+
+
+class StageTimer:
+    """
+    Collects wall-clock timings of named stages.
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+
+    def __call__(self, stage: str, func: Callable, *args):
+        """
+        Runs func(*args) and records its time under the stage name.
+
+        :return: whatever func returns.
+        """
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings[stage].append(time.perf_counter() - start)
+        return result
+
+    def summary(self) -> dict[str: dict[str: float]]:
+        """
+        :return: stage -> number of runs and mean/median/min/max time in seconds.
+        """
+        return {stage: {"runs": len(times),
+                        "mean_s": statistics.fmean(times),
+                        "median_s": statistics.median(times),
+                        "min_s": min(times),
+                        "max_s": max(times)}
+                for stage, times in self.timings.items()}
+
+
+def load_fixture_indexes(path: str = FIXTURE_PATH) -> tuple[SpatialIndex, SegmentIndex]:
+    """
+    :param path: Overpass-formatted json with the fixture elements.
+    :return: spatial and segment indexes of the fixture, in memory.
+    """
+    extract = extract_from_response_file(path)
+    return SpatialIndex(extract.node_ids, extract.lat, extract.lon), \
+        SegmentIndex.from_csr(extract.way_ptr, extract.way_nodes)
+
+
+def load_samples(samples_dir: str = SAMPLES_DIR) -> list[Graph]:
+    """
+    :param samples_dir: directory with the checked-in samples.
+    :return: graphs of all the samples.
+    """
+    graphs = []
+    for path in sorted(glob.glob(os.path.join(samples_dir, "*_src_dict.pickle"))):
+        with open(path, "rb") as handle:
+            graphs.append(Graph.from_adj_list(pickle.load(handle)))
+    return graphs
+
+
+def connected_nodes(segment_index: SegmentIndex, number_of_nodes: int, start: int) -> list[int]:
+    """
+    Takes number_of_nodes nodes of the fixture reachable from start, closest first.
+
+    :param segment_index: segments of the fixture;
+    :param number_of_nodes: size of the graph;
+    :param start: OSM id of the first node.
+    :return: OSM ids of the nodes.
+    """
+    nodes = {start}
+    queue = deque([start])
+    while queue and len(nodes) < number_of_nodes:
+        node = queue.popleft()
+        segments = segment_index.incident_segments([node])
+        for neighbour in [*segment_index.node_a[segments].tolist(), *segment_index.node_b[segments].tolist()]:
+            if neighbour not in nodes and len(nodes) < number_of_nodes:
+                nodes.add(neighbour)
+                queue.append(neighbour)
+    if len(nodes) < number_of_nodes:
+        raise ValueError(f"The fixture has no connected graph of {number_of_nodes} nodes.")
+    return list(nodes)
+
+
+def process_graph(timer: StageTimer, graph: Graph, name: str,
+                  file_writer: FileWriter, shard_writer: ShardWriter) -> None:
+    """
+    Runs every stage after sampling, as generate_sample does, plus both writers.
+    """
+    timer("is_connected", is_connected, graph)
+    pos_info, png = timer("draw_graph", draw_graph, None, graph)
+    img_size = png_size(png)
+    node_bboxes = timer("obtain_node_bboxes", obtain_node_bboxes, None, pos_info, img_size)
+    edge_bboxes = timer("obtain_edge_bboxes", obtain_edge_bboxes, None, graph, pos_info, img_size)
+
+    sample = Sample(name, png, graph, node_bboxes, edge_bboxes, img_size)
+    timer("write_files", file_writer.add, sample)
+    timer("write_shards", shard_writer.add, sample)
+
+
+def bench_stages(repeats: int, output_dir: str) -> dict:
+    """
+    :param repeats: number of sampled neighbourhoods;
+    :param output_dir: directory for the written samples.
+    :return: timings of every stage.
+    """
+    spatial_index, segment_index = load_fixture_indexes()
+    timer = StageTimer()
+
+    with FileWriter(output_dir) as file_writer, \
+            ShardWriter(os.path.join(output_dir, "stages_")) as shard_writer:
+        for sample_num in range(repeats):
+            random.seed(sample_num)
+            neighbours = timer("get_nodes_in_neighbourhood", get_nodes_in_neighbourhood, spatial_index)
+            timer("create_adj_list", create_adj_list, segment_index, neighbours)
+
+        for sample_num, graph in enumerate(load_samples()):
+            process_graph(timer, graph, f"stages_{sample_num}", file_writer, shard_writer)
+
+    return timer.summary()
+
+
+def bench_sizes(repeats: int, output_dir: str, sizes=GRAPH_SIZES) -> list[dict]:
+    """
+    :param repeats: number of samples of every size;
+    :param output_dir: directory for the written samples;
+    :param sizes: numbers of graph nodes.
+    :return: for every size: samples per second, peak memory and stage timings.
+    """
+    spatial_index, segment_index = load_fixture_indexes()
+    results = []
+
+    for number_of_nodes in sizes:
+        timer = StageTimer()
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        with FileWriter(output_dir) as file_writer, \
+                ShardWriter(os.path.join(output_dir, f"size_{number_of_nodes}_")) as shard_writer:
+            for sample_num in range(repeats):
+                random.seed(sample_num)
+                first_node = int(spatial_index.ids[random.randrange(len(spatial_index))])
+                nodes = connected_nodes(segment_index, number_of_nodes, first_node)
+                graph = timer("create_adj_list", create_adj_list, segment_index, nodes)
+                process_graph(timer, graph, f"size_{number_of_nodes}_{sample_num}",
+                              file_writer, shard_writer)
+
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results.append({"nodes": number_of_nodes,
+                        "samples": repeats,
+                        "samples_per_s": repeats / elapsed,
+                        # python allocations only, graphviz allocates outside of them
+                        "peak_python_memory_kb": peak / 1024,
+                        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                        "stages": timer.summary()})
+    return results
+
+
+def compare(results: dict, baseline: dict) -> None:
+    """
+    Prints median stage times of both runs and their ratio.
+    """
+    print(f"{'stage':<28}{'baseline, ms':>14}{'current, ms':>14}{'ratio':>8}")
+    for stage, timing in results["stages"].items():
+        if stage not in baseline["stages"]:
+            continue
+        old, new = baseline["stages"][stage]["median_s"], timing["median_s"]
+        print(f"{stage:<28}{old * 1e3:>14.3f}{new * 1e3:>14.3f}{new / old if old else float('nan'):>8.2f}")
+
+    old_sizes = {size["nodes"]: size for size in baseline["sizes"]}
+    for size in results["sizes"]:
+        if size["nodes"] in old_sizes:
+            old, new = old_sizes[size["nodes"]]["samples_per_s"], size["samples_per_s"]
+            print(f"{str(size['nodes']) + ' nodes, samples/s':<28}{old:>14.2f}{new:>14.2f}{new / old:>8.2f}")
+
+
+def main(repeats: int, output: Optional[str], baseline_path: Optional[str]) -> dict:
+    with tempfile.TemporaryDirectory() as output_dir:
+        results = {"meta": {"time": time.strftime("%Y%m%d_%H%M%S"),
+                            "python": platform.python_version(),
+                            "platform": platform.platform(),
+                            "repeats": repeats},
+                   "stages": bench_stages(repeats, output_dir),
+                   "sizes": bench_sizes(repeats, output_dir)}
+
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{results['meta']['time']}.json")
+    with open(output, "w") as fp:
+        json.dump(results, fp, indent=2)
+    print(f"Results are written to {output}")
+
+    if baseline_path is not None:
+        with open(baseline_path) as fp:
+            compare(results, json.load(fp))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=50, help="samples per stage and per graph size")
+    parser.add_argument("--output", help="json to write the results to, "
+                                         "by default benchmarks/results/bench_<time>.json")
+    parser.add_argument("--compare", dest="baseline", help="json of an earlier run to compare with")
+    args = parser.parse_args()
+    main(args.repeats, args.output, args.baseline)
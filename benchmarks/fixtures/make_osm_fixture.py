@@ -0,0 +1,62 @@
+"""
+Makes osm_fixture.json - a small stand-in for an Overpass response,
+so that the benchmarks never query OSM.
+
+The paths are a jittered street grid: NODES_PER_SIDE x NODES_PER_SIDE nodes
+STEP degrees apart, rows and columns are cut into ways at random points
+and some segments are missing, as on a real map.
+
+Usage: python -m benchmarks.fixtures.make_osm_fixture
+"""
+import random
+import json
+import os
+
+NODES_PER_SIDE = 20
+STEP = 0.00065  # a NEIGHBOURHOOD_SIZE square holds ~9 nodes
+JITTER = 0.00008
+ORIGIN = (55.75, 37.60)  # Moscow
+MISSING_SEGMENT_SHARE = 0.1
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "osm_fixture.json")
+
+
+def make_elements(seed: int = 0) -> list[dict]:
+    """
+    :param seed: seed of the grid jitter and of the cuts.
+    :return: Overpass json 'elements': nodes, then ways.
+    """
+    rng = random.Random(seed)
+    base_lat, base_lon = ORIGIN
+
+    def node_id(row: int, col: int) -> int:
+        return 1_000_000 + row * NODES_PER_SIDE + col
+
+    nodes = [{"type": "node",
+              "id": node_id(row, col),
+              "lat": round(base_lat + row * STEP + rng.uniform(-JITTER, JITTER), 7),
+              "lon": round(base_lon + col * STEP + rng.uniform(-JITTER, JITTER), 7)}
+             for row in range(NODES_PER_SIDE) for col in range(NODES_PER_SIDE)]
+
+    lines = [[node_id(row, col) for col in range(NODES_PER_SIDE)] for row in range(NODES_PER_SIDE)] + \
+            [[node_id(row, col) for row in range(NODES_PER_SIDE)] for col in range(NODES_PER_SIDE)]
+
+    ways = []
+    for line in lines:
+        way = [line[0]]
+        for node in line[1:]:
+            if rng.random() < MISSING_SEGMENT_SHARE:
+                if len(way) > 1:
+                    ways.append(way)
+                way = [node]
+            else:
+                way.append(node)
+        if len(way) > 1:
+            ways.append(way)
+
+    return nodes + [{"type": "way", "id": 2_000_000 + num, "nodes": way, "tags": {"highway": "path"}}
+                    for num, way in enumerate(ways)]
+
+
+if __name__ == "__main__":
+    with open(FIXTURE_PATH, "w") as fp:
+        json.dump({"elements": make_elements()}, fp, separators=(",", ":"))
@@ -1,53 +1,46 @@
+from src.data_generator.graph import Graph
 from src.data_generator.util import CategoryId
 from typing import Union, Tuple
-from cv2 import imread
 import pickle
 import pathlib
 import time
 import json
 import os
 
+# Version of the annotation format, it is written to every COCO json.
+# Jsons without it (ex.: the samples in data/) have the categories of the edges swapped:
+# an edge of type 1, drawn with two lines, was annotated as EDGE_TYPE_1 (one line) and vice versa.
+ANNOTATION_FORMAT_VERSION = 2
 
-def data_to_pickle(file_prefix: Union[str, pathlib.Path],
-                   graph_adj_list: dict[str: dict[str: dict[str: Union[str, int]]]]) -> None:
+
+def data_to_pickle(file_prefix: Union[str, pathlib.Path], graph: Graph) -> None:
     """
-    Saves adjacency list represented graph to binary format for the Checker.
+    Saves the adjacency list of the graph to binary format for the Checker,
+    ex.: {'R2': {'D2': {'weight': '1', 'type': 2}, ...}, ...}.
 
     :param file_prefix: name prefix of the respective png file;
-    :param graph_adj_list: adjacency-list represented graph,
-                           ex.: {'R2': {'D2': {'weight': '1', 'type': 0}, ...}, ...}.
-                           Weight isn't used and is always '1', we keep it to satisfy
-                           Problem API.
+    :param graph: the graph.
     :return: pickle is written to the file-system.
     """
     filename = file_prefix + "_src_dict.pickle"
     with open(filename, "wb") as handle:
-        pickle.dump(graph_adj_list, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(graph.to_adj_list(), handle, protocol=pickle.HIGHEST_PROTOCOL)
 
 
-def COCO_annotate_image(filepath: Union[str, pathlib.Path],
-                        node_bboxes: list[dict[str: Tuple[int, int]]],
-                        edge_bboxes: list[dict[str: Union[Tuple[int, int]], int]]) -> None:
+def COCO_annotations(node_bboxes: list[dict[str: Tuple[int, int]]],
+                     edge_bboxes: list[dict[str: Union[Tuple[int, int]], int]]) -> list[dict]:
     """
-    Joins all info for model training in COCO-formatted json.
+    Converts bboxes to COCO-formatted annotations.
 
-    :param filepath: name prefix of the respective png file;
     :param node_bboxes: node boundboxes as list of dictionaries
                         in this form [{"upper_left": (x1, y1), "lower_right": (x2, y2)}]
     :param edge_bboxes: edge boundboxes as list of dictionaries
                         in this form [{"type": <edge_type>,
-                                       "upper_left": (x1, y1), "lower_right": (x2, y2)}]
-    :return: pickle is written to the file-system.
+                                       "upper_left": (x1, y1), "lower_right": (x2, y2)}].
+    :return: annotations in this form [{"bbox": [x1, y1, x2, y2], "bbox_mode": 0, "category_id": 0}, ...].
     """
-    img = imread(os.path.abspath(filepath + ".png"))
-
-    coco_obj = {'file_name': filepath + ".png",
-                'width': len(img[0]),
-                'height': len(img),
-                'image_id': os.path.basename(filepath),
-                'annotations': []}
+    annotations = []
 
-    # Create annotations
     for node_bbox in node_bboxes:
         annot = {}
         x1, y1 = node_bbox["upper_left"]
@@ -55,7 +48,7 @@ def COCO_annotate_image(filepath: Union[str, pathlib.Path],
         annot['bbox'] = [x1, y1, x2, y2]
         annot['bbox_mode'] = 0  # BoxMode.XYXY_ABS
         annot['category_id'] = CategoryId.NODE
-        coco_obj['annotations'].append(annot)
+        annotations.append(annot)
 
     for edge_bbox in edge_bboxes:
         annot = {}
@@ -63,8 +56,37 @@ def COCO_annotate_image(filepath: Union[str, pathlib.Path],
         x2, y2 = edge_bbox["lower_right"]
         annot['bbox'] = [x1, y1, x2, y2]
         annot['bbox_mode'] = 0  # BoxMode.XYXY_ABS
-        annot['category_id'] = CategoryId.EDGE_TYPE_1 if edge_bbox["type"]==1 else CategoryId.EDGE_TYPE_2
-        coco_obj['annotations'].append(annot)
+        # edge type in the adjacency list is already a CategoryId, draw_graph relies on it too
+        annot['category_id'] = CategoryId(edge_bbox["type"])
+        annotations.append(annot)
+
+    return annotations
+
+
+def COCO_annotate_image(filepath: Union[str, pathlib.Path],
+                        node_bboxes: list[dict[str: Tuple[int, int]]],
+                        edge_bboxes: list[dict[str: Union[Tuple[int, int]], int]],
+                        img_size: Tuple[int, int]) -> None:
+    """
+    Joins all info for model training in COCO-formatted json.
+
+    :param filepath: name prefix of the respective png file;
+    :param node_bboxes: node boundboxes as list of dictionaries
+                        in this form [{"upper_left": (x1, y1), "lower_right": (x2, y2)}]
+    :param edge_bboxes: edge boundboxes as list of dictionaries
+                        in this form [{"type": <edge_type>,
+                                       "upper_left": (x1, y1), "lower_right": (x2, y2)}];
+    :param img_size: width and height of the png in pixels.
+    :return: pickle is written to the file-system.
+    """
+    width, height = img_size
+
+    coco_obj = {'file_name': filepath + ".png",
+                'width': width,
+                'height': height,
+                'image_id': os.path.basename(filepath),
+                'format_version': ANNOTATION_FORMAT_VERSION,
+                'annotations': COCO_annotations(node_bboxes, edge_bboxes)}
 
     with open(filepath + '.json', 'w') as fp:
-        json.dump(coco_obj, fp)
\ No newline at end of file
+        json.dump(coco_obj, fp)
@@ -0,0 +1,161 @@
+from src.data_generator.rasterize import MIN_IMG_SIZE, MAX_IMG_SIZE, BORDER
+from src.data_generator.writers import Sample
+from src.data_generator.util import CategoryId, Shift
+from enum import IntEnum
+from typing import Optional, Union, Tuple
+import numpy as np
+import cv2
+
+# qualities a variant is re-encoded with, None - the variant stays lossless
+JPEG_QUALITIES = (None, 95, 75, 50, 30)
+# range of the scale of a variant, it is narrowed to keep the image within MIN_IMG_SIZE..MAX_IMG_SIZE
+SCALE_RANGE = (0.75, 1.25)
+# px a margin may exceed BORDER by
+MAX_EXTRA_MARGIN = 20
+# max change of a color channel
+COLOR_JITTER = 40
+# share of the node bbox half-side that is the label, the rest of the node is the circle
+LABEL_SHARE = 0.6
+WHITE = (255, 255, 255)
+
+
+class Ink(IntEnum):
+    """
+    What a drawn pixel belongs to.
+    """
+    OTHER = 0
+    NODE = 1
+    LABEL = 2
+    EDGE_TYPE_1 = 3
+    EDGE_TYPE_2 = 4
+
+
+# BGR colors the README asks for: green nodes, blue labels, black one-line and red two-line edges
+INK_COLORS = np.array([(0, 0, 0), (0, 160, 0), (200, 0, 0), (0, 0, 0), (0, 0, 220)], dtype=np.int64)
+
+
+def _bbox_array(bboxes: list[dict[str: Union[Tuple[int, int], int]]]) -> np.ndarray:
+    """
+    :return: (K, 4) array of x1, y1, x2, y2 - the "upper_left" and "lower_right" corners.
+    """
+    return np.array([(*bbox["upper_left"], *bbox["lower_right"]) for bbox in bboxes],
+                    dtype=np.float64).reshape(-1, 4)
+
+
+def ink_map(img: np.ndarray, node_boxes: np.ndarray, edge_boxes: np.ndarray, edge_types: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds how much ink every pixel has and what it belongs to.
+    Edge pixels are told apart by the bboxes of the edges, where bboxes overlap the smaller one wins,
+    pixels inside a node circle belong to the node or to its label.
+
+    :param img: BGR image, dark drawing on a white background;
+    :param node_boxes: (N, 4) array of x1, y1, x2, y2;
+    :param edge_boxes: (E, 4) array of x1, y1, x2, y2;
+    :param edge_types: (E,) array of the edge types.
+    :return: (H, W) float array of ink amount, 0..1, + (H, W) array of Ink values.
+    """
+    alpha = (255 - img.min(axis=2)).astype(np.float32) / 255
+    ink = np.full(alpha.shape, Ink.OTHER, dtype=np.uint8)
+
+    areas = np.abs(edge_boxes[:, 2] - edge_boxes[:, 0]) * np.abs(edge_boxes[:, 3] - edge_boxes[:, 1])
+    for num in np.argsort(-areas, kind="stable").tolist():
+        x1, y1, x2, y2 = np.round(edge_boxes[num]).astype(int).tolist()
+        value = Ink.EDGE_TYPE_2 if edge_types[num]==CategoryId.EDGE_TYPE_2 else Ink.EDGE_TYPE_1
+        cv2.rectangle(ink, (x1, y1), (x2, y2), int(value), cv2.FILLED)
+
+    for x1, y1, x2, y2 in node_boxes.tolist():
+        center = (round((x1 + x2) / 2), round((y1 + y2) / 2))
+        half_side = min(abs(x2 - x1), abs(y2 - y1)) / 2
+        cv2.circle(ink, center, round(half_side), int(Ink.NODE), cv2.FILLED)
+        cv2.circle(ink, center, round(half_side * LABEL_SHARE), int(Ink.LABEL), cv2.FILLED)
+
+    return alpha, ink
+
+
+def _content_box(alpha: np.ndarray) -> Tuple[int, int, int, int]:
+    """
+    :return: x1, y1, x2, y2 (exclusive) of the drawn part of the image.
+    """
+    rows, cols = np.flatnonzero(alpha.any(axis=1)), np.flatnonzero(alpha.any(axis=0))
+    if not len(rows):
+        return 0, 0, alpha.shape[1], alpha.shape[0]
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def _to_bboxes(boxes: np.ndarray, img_size: Tuple[int, int], types: Optional[list[int]] = None) -> list[dict]:
+    """
+    :return: boxes in the form of obtain_node_bboxes, or of obtain_edge_bboxes if types are given,
+             clipped as they are clipped there.
+    """
+    width, height = img_size
+    boxes = np.round(boxes).astype(np.int64)
+    boxes[:, 0::2] = np.clip(boxes[:, 0::2], Shift.SHIFT_FROM_BORDER, width - Shift.SHIFT_FROM_BORDER)
+    boxes[:, 1::2] = np.clip(boxes[:, 1::2], Shift.SHIFT_FROM_BORDER, height - Shift.SHIFT_FROM_BORDER)
+    if types is None:
+        return [{"upper_left": (x1, y1), "lower_right": (x2, y2)} for x1, y1, x2, y2 in boxes.tolist()]
+    return [{"type": edge_type, "upper_left": (x1, y1), "lower_right": (x2, y2)}
+            for edge_type, (x1, y1, x2, y2) in zip(types, boxes.tolist())]
+
+
+def augment_sample(sample: Sample, k: int, seed: int,
+                   qualities: Tuple = JPEG_QUALITIES) -> list[Sample]:
+    """
+    Derives k variants of a drawn sample in memory, without another layout:
+    the drawing is recolored with jittered colors, rescaled, put on a canvas with random margins
+    (at least BORDER px wide) and re-encoded as jpeg, bboxes are moved along.
+    Variants are still pngs, jpeg artifacts are baked in.
+
+    :param sample: drawn sample with its bboxes;
+    :param k: number of variants;
+    :param seed: the same seed gives the same variants;
+    :param qualities: jpeg qualities to choose from, None - no re-encoding.
+    :return: the variants, named <name>_aug<num>, they share the graph of the sample.
+    """
+    rng = np.random.default_rng(seed)
+    img = cv2.imdecode(np.frombuffer(sample.png, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    node_boxes, edge_boxes = _bbox_array(sample.node_bboxes), _bbox_array(sample.edge_bboxes)
+    edge_types = [edge_bbox["type"] for edge_bbox in sample.edge_bboxes]
+    alpha, ink = ink_map(img, node_boxes, edge_boxes, np.array(edge_types, dtype=np.int64))
+
+    # the variants are made of the drawn part only
+    x1, y1, x2, y2 = _content_box(alpha)
+    alpha, ink = alpha[y1:y2, x1:x2, None], ink[y1:y2, x1:x2]
+    node_boxes = node_boxes - [x1, y1, x1, y1]
+    edge_boxes = edge_boxes - [x1, y1, x1, y1]
+    content_height, content_width = ink.shape
+
+    max_margin = BORDER + MAX_EXTRA_MARGIN
+    min_scale = max(SCALE_RANGE[0], (MIN_IMG_SIZE - 2 * BORDER) / max(min(content_width, content_height), 1))
+    max_scale = min(SCALE_RANGE[1], (MAX_IMG_SIZE - 2 * max_margin) / max(content_width, content_height, 1))
+
+    variants = []
+    for num in range(k):
+        colors = np.clip(INK_COLORS + rng.integers(-COLOR_JITTER, COLOR_JITTER + 1, INK_COLORS.shape), 0, 255)
+        recolored = (255 - alpha * (255 - colors[ink])).astype(np.uint8)
+
+        scale = rng.uniform(min_scale, max_scale) if min_scale < max_scale else max_scale
+        width, height = max(round(content_width * scale), 1), max(round(content_height * scale), 1)
+        resized = cv2.resize(recolored, (width, height),
+                             interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+
+        left, top, right, bottom = rng.integers(BORDER, max_margin + 1, 4).tolist()
+        right += max(MIN_IMG_SIZE - (left + width + right), 0)
+        bottom += max(MIN_IMG_SIZE - (top + height + bottom), 0)
+        canvas = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=WHITE)
+
+        quality = qualities[rng.integers(len(qualities))]
+        if quality is not None:
+            _, jpg = cv2.imencode(".jpg", canvas, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+            canvas = cv2.imdecode(jpg, cv2.IMREAD_COLOR)
+        _, png = cv2.imencode(".png", canvas)
+
+        factor = np.array([width / content_width, height / content_height] * 2)
+        shift = np.array([left, top] * 2)
+        img_size = (canvas.shape[1], canvas.shape[0])
+        variants.append(Sample(f"{sample.name}_aug{num}", png.tobytes(), sample.graph,
+                               _to_bboxes(node_boxes * factor + shift, img_size),
+                               _to_bboxes(edge_boxes * factor + shift, img_size, edge_types),
+                               img_size))
+    return variants
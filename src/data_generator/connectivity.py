@@ -1,28 +1,127 @@
-import networkx as nx
+from src.data_generator.graph import Graph
+from typing import Hashable, Iterable, Union, Tuple
+import numpy as np
 
 
-def adj_to_networkX(adj_list: dict[str: list[str]]) -> nx.Graph:
+class UnionFind:
     """
-    Converts our custom adjacency list (sampled from OSM) formatted graph to networkX graph.
-    OSM - open street map.
-    :param adj_list: adjacency-list represented graph,
-                     ex.: {'R2': ['D2', ...], ...}.
-    :return: graph in networkX format.
+    Disjoint sets of graph nodes, edges are merged in one by one,
+    so connectivity is known at any moment while a graph is being built.
+
+    Nodes may be anything hashable: OSM node ids or our node names.
+    Union by size + path halving.
     """
-    G = nx.Graph()
-    for node1, adj in adj_list.items():
-        for node2 in adj:
-            G.add_edge(node1, node2)
-    return G
 
+    def __init__(self, nodes: Iterable[Hashable] = ()):
+        """
+        :param nodes: initial nodes, every one in its own component.
+        """
+        self.parent = {}
+        self.size = {}
+        for node in nodes:
+            self.add(node)
+
+    @classmethod
+    def from_edges(cls, edges: Iterable[Tuple[Hashable, Hashable]]) -> 'UnionFind':
+        """
+        :param edges: node pairs, ex.: (E, 2) array from SegmentIndex.edges_within.
+        :return: components of the graph made of these edges.
+        """
+        union_find = cls()
+        for node_1, node_2 in (edges.tolist() if isinstance(edges, np.ndarray) else edges):
+            union_find.union(node_1, node_2)
+        return union_find
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    def add(self, node: Hashable) -> None:
+        if node not in self.parent:
+            self.parent[node] = node
+            self.size[node] = 1
+
+    def find(self, node: Hashable) -> Hashable:
+        """
+        :return: root of the component of the node.
+        """
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, node_1: Hashable, node_2: Hashable) -> bool:
+        """
+        Adds the edge, unknown nodes are added first.
+
+        :return: whether or not the edge joined two components.
+        """
+        self.add(node_1)
+        self.add(node_2)
+        root_1, root_2 = self.find(node_1), self.find(node_2)
+        if root_1 == root_2:
+            return False
+        if self.size[root_1] < self.size[root_2]:
+            root_1, root_2 = root_2, root_1
+        self.parent[root_2] = root_1
+        self.size[root_1] += self.size.pop(root_2)
+        return True
+
+    @property
+    def n_components(self) -> int:
+        return len(self.size)
+
+    def component_sizes(self) -> list[int]:
+        """
+        :return: sizes of all the components, largest first.
+        """
+        return sorted(self.size.values(), reverse=True)
 
-def is_connected(adj_list) -> bool:
+    def largest_component(self) -> set:
+        """
+        :return: nodes of the largest component (of any of them on a tie).
+        """
+        if not self.size:
+            return set()
+        root = max(self.size, key=self.size.get)
+        return {node for node in self.parent if self.find(node) == root}
+
+
+def is_connected(graph: Union[Graph, dict]) -> bool:
     """
-    Checks if our custom adjacency list (sampled from OSM) is connected.
+    Checks if our custom graph (sampled from OSM) is connected.
     OSM - open street map.
-    :param adj_list: adjacency-list represented graph,
-                     ex.: {'R2': ['D2', ...], ...}.
+    :param graph: the graph or its adjacency list,
+                  ex.: {'R2': ['D2', ...], ...}.
     :return: whether or not the graph is connected.
     """
-    G = adj_to_networkX(adj_list)
-    return nx.is_connected(G) if G else False
+    return len(component_sizes(graph)) == 1
+
+
+def component_sizes(graph: Union[Graph, dict]) -> list[int]:
+    """
+    :param graph: the graph or its adjacency list,
+                  ex.: {'R2': ['D2', ...], ...}.
+    :return: sizes of the connected components, largest first.
+    """
+    if isinstance(graph, Graph):
+        # nodes are numbers, the edges are merged straight from their array
+        union_find = UnionFind.from_edges(graph.edges)
+        isolated = [1] * (len(graph) - len(union_find))
+        return sorted([*union_find.size.values(), *isolated], reverse=True)
+    union_find = UnionFind(graph)
+    for node_1, adj in graph.items():
+        for node_2 in adj:
+            union_find.union(node_1, node_2)
+    return union_find.component_sizes()
+
+
+def largest_component_edges(edges: np.ndarray, union_find: UnionFind) -> np.ndarray:
+    """
+    :param edges: (E, 2) array of node id pairs;
+    :param union_find: components of the graph made of these edges.
+    :return: the edges of the largest component, in their original order.
+    """
+    nodes = union_find.largest_component()
+    keep = np.fromiter((node_1 in nodes for node_1, _ in edges.tolist()), dtype=bool, count=len(edges))
+    return edges[keep]
@@ -0,0 +1,132 @@
+from collections import defaultdict
+from typing import Optional
+import numpy as np
+import hashlib
+import json
+import os
+
+
+def topology_hash(edges: np.ndarray) -> str:
+    """
+    Canonical hash of a sampled subgraph: it depends only on its OSM node ids
+    and OSM segments, not on the random node names, edge types or edge order.
+
+    :param edges: (E, 2) array of OSM node id pairs (see SegmentIndex.edges_within).
+    :return: hex digest.
+    """
+    edges = np.sort(np.asarray(edges, dtype=np.int64).reshape(-1, 2), axis=1)
+    edges = np.unique(edges, axis=0)
+    nodes = np.unique(edges)
+
+    digest = hashlib.sha1()
+    digest.update(len(nodes).to_bytes(8, "little"))
+    digest.update(nodes.astype("<i8").tobytes())
+    digest.update(edges.astype("<i8").tobytes())
+    return digest.hexdigest()
+
+
+class GraphIndex:
+    """
+    Topology hash -> names of the samples drawn from it.
+
+    It is kept on disk between runs, so a subgraph never gets into the data
+    more than max_repeats times, ex.: into both train and validation samples.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_repeats: int = 1):
+        """
+        :param path: json file of the index, it is read if it exists;
+        :param max_repeats: how many samples of the same subgraph are allowed.
+        """
+        self.path = path
+        self.max_repeats = max_repeats
+        self.samples = defaultdict(list)
+        if path is not None and os.path.isfile(path):
+            with open(path) as fp:
+                self.samples.update(json.load(fp))
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def add(self, topology: str, name: str) -> bool:
+        """
+        :param topology: topology hash of the sample;
+        :param name: name of the sample, ex.: "graph_20221122_022933_1186".
+        :return: whether or not the sample is allowed, it is recorded only if it is.
+                 A sample already recorded is allowed, ex.: screened again by a resumed run.
+        """
+        if name in self.samples[topology]:
+            return True
+        if len(self.samples[topology]) >= self.max_repeats:
+            return False
+        self.samples[topology].append(name)
+        return True
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(self.samples, fp)
+        os.replace(tmp_path, self.path)
+
+
+class LayoutCache:
+    """
+    Node positions of laid out subgraphs, stored as one json per topology hash.
+
+    Positions are kept per OSM node id, so a variant of the subgraph
+    with other names or edge types is drawn without running the layout again.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        :param cache_dir: directory of the cached layouts, shared by the worker processes.
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, topology: str) -> str:
+        return os.path.join(self.cache_dir, topology + ".json")
+
+    def get(self, topology: str) -> Optional[dict]:
+        """
+        :param topology: topology hash of the subgraph.
+        :return: OSM node id -> positioning info (see visualize.get_pos_info), None on a miss.
+        """
+        path = self._path(topology)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as fp:
+            return {int(node_id): info for node_id, info in json.load(fp).items()}
+
+    def put(self, topology: str, layout: dict[int: dict[str: float]]) -> None:
+        """
+        :param topology: topology hash of the subgraph;
+        :param layout: OSM node id -> positioning info (see visualize.get_pos_info).
+        """
+        # a unique tmp name, several workers may lay out the same subgraph at once
+        tmp_path = f"{self._path(topology)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(layout, fp)
+        os.replace(tmp_path, self._path(topology))
+
+
+def pos_info_by_node_id(pos_info: dict[str: dict[str: float]],
+                        node_name_dict: dict[int: str]) -> dict[int: dict[str: float]]:
+    """
+    :param pos_info: node name -> positioning info;
+    :param node_name_dict: OSM node id -> node name.
+    :return: OSM node id -> positioning info.
+    """
+    return {node_id: dict(pos_info[name]) for node_id, name in node_name_dict.items()}
+
+
+def pos_info_by_name(layout: dict[int: dict[str: float]],
+                     node_name_dict: dict[int: str]) -> dict[str: dict[str: float]]:
+    """
+    :param layout: OSM node id -> positioning info;
+    :param node_name_dict: OSM node id -> node name.
+    :return: node name -> positioning info.
+    """
+    return {name: layout[node_id] for node_id, name in node_name_dict.items()}
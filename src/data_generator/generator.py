@@ -1,49 +1,529 @@
 from src.data_generator.osm_sampler import get_nodes_in_neighbourhood, \
-    create_adj_list, \
-    query_from_OSM
+    create_adj_list
+from src.data_generator.osm_fetch import get_merged_extract_path, BBox
+from src.data_generator.osm_index import load_indexes, load_seed_positions
 from src.data_generator.visualize import draw_graph, \
     obtain_node_bboxes, \
     obtain_edge_bboxes
-from src.data_generator.annotations import COCO_annotate_image, \
-    data_to_pickle
-from src.data_generator.connectivity import is_connected
+from src.data_generator.rasterize import rasterize_graph
+from src.data_generator.augment import augment_sample
+from src.data_generator.writers import Sample, FileWriter, ShardWriter, \
+    SAMPLES_PER_SHARD
+from src.data_generator.connectivity import UnionFind, largest_component_edges
+from src.data_generator.dedupe import GraphIndex, LayoutCache, topology_hash, \
+    pos_info_by_node_id, \
+    pos_info_by_name
+from src.data_generator.metrics import Metrics, NullMetrics, NULL_METRICS
+from src.data_generator.graph import Graph
+from src.data_generator.manifest import RunManifest, remove_partial_samples
+from src.data_generator.util import png_size
+from multiprocessing import Pool
+from collections import Counter
+from contextlib import nullcontext
+from typing import Optional, Union, Tuple, Iterable, Callable
+from enum import Enum
 from tqdm import tqdm
+import hashlib
+import math
+import random
 import time
 import os
 
 MAX_NUMBER_OF_NODES = 13
 MIN_NUMBER_OF_NODES = 6
+# until_accepted mode gives up if the acceptance rate falls below 1 / MAX_ATTEMPTS_PER_SAMPLE
+MAX_ATTEMPTS_PER_SAMPLE = 100
+RENDERERS = ("graphviz", "native")
 
+# Indexes of the OSM extract, every worker process maps them once,
+# the writer of the worker if it writes samples itself,
+# whether or not it collects metrics, the layout cache and the number of augmented variants.
+_worker_state = {}
 
-def generate_data(n: int):
+
+class Rejection(str, Enum):
+    """
+    Reasons to reject a sampled graph.
+    """
+    TOO_FEW_NODES = "too few nodes"
+    TOO_MANY_NODES = "too many nodes"
+    DISCONNECTED = "disconnected"
+    DUPLICATE = "duplicate"
+
+
+def _init_worker(extract_path: str, output_dir: Optional[str] = None,
+                 collect_metrics: bool = False,
+                 layout_cache_dir: Optional[str] = None,
+                 augmentations: int = 0) -> None:
+    """
+    Worker process initializer: memory-maps the shared read-only OSM indexes,
+    so that they are never pickled into tasks.
+
+    :param extract_path: directory of the cached OSM extract;
+    :param output_dir: if given, the worker writes per-file samples there itself;
+    :param collect_metrics: whether or not tasks time their stages (see metrics.Metrics);
+    :param layout_cache_dir: if given, graphviz layouts are cached there (see dedupe.LayoutCache);
+    :param augmentations: number of variants derived from every drawn sample (see augment.augment_sample).
+    """
+    _worker_state["spatial_index"], _worker_state["segment_index"] = load_indexes(extract_path)
+    _worker_state["seed_positions"] = load_seed_positions(extract_path, MIN_NUMBER_OF_NODES)
+    _worker_state["writer"] = FileWriter(output_dir) if output_dir is not None else None
+    _worker_state["collect_metrics"] = collect_metrics
+    _worker_state["layout_cache"] = LayoutCache(layout_cache_dir) if layout_cache_dir is not None else None
+    _worker_state["augmentations"] = augmentations
+
+
+def sample_seed(seed: int, sample_num: int) -> int:
+    """
+    Derives the seed of a single sample, it depends only on the run seed
+    and on the sample number, not on the worker that happens to process it.
+
+    :param seed: seed of the whole run;
+    :param sample_num: number of the sample in the run.
+    :return: 64-bit seed of the sample.
+    """
+    digest = hashlib.sha256(f"{seed}:{sample_num}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+def sample_graph(sample_num: int, seed: int, keep_largest_component: bool = False,
+                 metrics: Union[Metrics, NullMetrics] = NULL_METRICS,
+                 node_name_dict: Optional[dict] = None) \
+        -> Tuple[Optional[Graph], Optional[Rejection], Optional[str]]:
+    """
+    Samples the graph of one sample and checks it, nothing is drawn.
+    The same sample_num and seed always give the same graph.
+
+    Size and connectivity are checked on the OSM segments of the neighbourhood,
+    so rejected graphs never get to naming.
+
+    :param sample_num: number of the sample in the run;
+    :param seed: seed of the whole run;
+    :param keep_largest_component: False - disconnected graphs are rejected,
+                                   True - only their largest component is kept;
+    :param metrics: stages are timed there, if enabled;
+    :param node_name_dict: if given, OSM node id -> node name of the accepted graph is filled in there.
+    :return: the graph (None if rejected)
+             + the reason to reject it, None if it is accepted
+             + topology hash of the accepted graph (see dedupe.topology_hash).
+    """
+    random.seed(sample_seed(seed, sample_num))
+
+    with metrics.stage("sampling"):
+        neighbours = get_nodes_in_neighbourhood(_worker_state["spatial_index"],
+                                                seed_positions=_worker_state["seed_positions"])
+    with metrics.stage("adjacency"):
+        edges = _worker_state["segment_index"].edges_within(neighbours)
+
+    with metrics.stage("connectivity"):
+        components = UnionFind.from_edges(edges)
+        is_disconnected = components.n_components > 1
+        if is_disconnected and keep_largest_component:
+            edges = largest_component_edges(edges, components)
+            number_of_nodes = components.component_sizes()[0]
+        else:
+            number_of_nodes = len(components)
+
+    if number_of_nodes <= MIN_NUMBER_OF_NODES:
+        return None, Rejection.TOO_FEW_NODES, None
+    if number_of_nodes >= MAX_NUMBER_OF_NODES:
+        return None, Rejection.TOO_MANY_NODES, None
+
+    if is_disconnected and not keep_largest_component:
+        return None, Rejection.DISCONNECTED, None
+
+    with metrics.stage("adjacency"):
+        graph = create_adj_list(_worker_state["segment_index"], neighbours, edges, node_name_dict)
+    return graph, None, topology_hash(edges)
+
+
+def generate_sample(sample_num: int, seed: int, file_prefix: str,
+                    keep_largest_component: bool = False,
+                    renderer: str = "graphviz",
+                    screened: bool = False,
+                    metrics: Union[Metrics, NullMetrics] = NULL_METRICS) \
+        -> Tuple[Optional[Rejection], Optional[Sample], Optional[str]]:
+    """
+    Samples one graph, draws it and builds its annotations.
+
+    :param sample_num: number of the sample in the run, it makes the file name unique;
+    :param seed: seed of the whole run;
+    :param file_prefix: name prefix shared by all the samples of the run;
+    :param keep_largest_component: see sample_graph;
+    :param renderer: "graphviz" - sfdp layout (see visualize.draw_graph),
+                     "native" - nodes at their OSM coordinates (see rasterize.rasterize_graph);
+    :param screened: the graph was already sampled and timed by screening (see _screen_round),
+                     sampling it again is timed as the "resample" stage only;
+    :param metrics: stages are timed there, if enabled.
+    :return: the reason to reject the sample + the sample, None if it was rejected
+             + topology hash of the graph, None if it was rejected before hashing.
+    """
+    node_name_dict = dict()
+    with metrics.stage("resample") if screened else nullcontext():
+        graph, rejection, topology = sample_graph(sample_num, seed, keep_largest_component,
+                                                  NULL_METRICS if screened else metrics, node_name_dict)
+    if rejection is not None:
+        return rejection, None, topology
+    metrics.count_graph(graph)
+
+    if renderer == "native":
+        spatial_index = _worker_state["spatial_index"]
+        positions = spatial_index.locate(list(node_name_dict.keys()))
+        coords = {name: (lat, lon) for name, lat, lon in zip(node_name_dict.values(),
+                                                              spatial_index.lat[positions].tolist(),
+                                                              spatial_index.lon[positions].tolist())}
+        png, node_bboxes, edge_bboxes = rasterize_graph(graph, coords, metrics)
+        img_size = png_size(png)
+    else:
+        # a variant of an already drawn subgraph reuses its layout
+        layout_cache = _worker_state["layout_cache"]
+        layout = layout_cache.get(topology) if layout_cache is not None else None
+        pos_info = pos_info_by_name(layout, node_name_dict) if layout is not None else None
+
+        pos_info, png = draw_graph(None, graph, metrics, pos_info)
+        img_size = png_size(png)
+        if layout_cache is not None and layout is None:
+            layout_cache.put(topology, pos_info_by_node_id(pos_info, node_name_dict))
+
+        with metrics.stage("bbox"):
+            node_bboxes = obtain_node_bboxes(None, pos_info, img_size)
+            edge_bboxes = obtain_edge_bboxes(None, graph, pos_info, img_size)
+
+    sample = Sample(file_prefix + str(sample_num), png, graph, node_bboxes, edge_bboxes, img_size)
+    return None, sample, topology
+
+
+def generate_data(n: int,
+                  offline: bool = False,
+                  workers: int = 1,
+                  areas: Iterable[str] = ('Москва',),
+                  bbox: Optional[BBox] = None,
+                  seed: Optional[int] = None,
+                  output: str = "files",
+                  samples_per_shard: int = SAMPLES_PER_SHARD,
+                  until_accepted: bool = False,
+                  keep_largest_component: bool = False,
+                  renderer: str = "graphviz",
+                  max_repeats: Optional[int] = None,
+                  graph_index_path: Optional[str] = None,
+                  layout_cache_dir: Optional[str] = None,
+                  metrics_path: Optional[str] = None,
+                  profiler: Optional[Callable[[str, float], None]] = None,
+                  augmentations: int = 0,
+                  manifest_path: Optional[str] = None) -> dict[str: int]:
     """
     Generate n images with corresponding COCO-annotations and pickled adjacency lists.
 
-    :param n: number of samples to generate.
-    :return: 3 files for each of n graphs are written to the file-system.
+    Neighbourhoods are only centred at nodes that have enough nodes around them
+    (see osm_index.find_seed_positions), the rest can never give a valid graph.
+
+    :param n: number of samples to generate;
+    :param offline: use only the locally cached OSM extract, never query OSM;
+    :param workers: number of worker processes, OSM indexes are shared
+                    between them through read-only memory maps;
+    :param areas: names of the OSM areas to sample from;
+    :param bbox: (south, west, north, east) in degrees, if given, paths in it are sampled from too,
+                 it is fetched tile by tile (see osm_fetch.get_merged_extract_path);
+    :param seed: seed of the run, the same seed gives the same samples
+                 for any number of workers. Random if not given;
+    :param output: "files" - 3 files for every sample (see writers.FileWriter),
+                   "shards" - tar shards with consolidated annotations (see writers.ShardWriter);
+    :param samples_per_shard: number of samples in a shard for output="shards";
+    :param until_accepted: False - make n attempts, rejected samples are just skipped,
+                           True - keep sampling until exactly n samples are accepted.
+                           Graphs are screened first, so only accepted ones are drawn;
+    :param keep_largest_component: False - disconnected graphs are rejected,
+                                   True - the largest component of such a graph is drawn
+                                   if it is big enough;
+    :param renderer: "graphviz" - sfdp layout, bboxes are estimated from node positions,
+                     "native" - nodes are drawn at their OSM coordinates with OpenCV,
+                     bboxes are exact (see rasterize.rasterize_graph);
+    :param max_repeats: if given, at most max_repeats samples are drawn from the same OSM subgraph
+                        (see dedupe.topology_hash), the rest are rejected as duplicates;
+    :param graph_index_path: json index of the subgraphs drawn so far (see dedupe.GraphIndex),
+                             it is updated at the end of the run, so that the next runs don't repeat
+                             this one. Duplicates are capped at max_repeats, 1 if not given;
+    :param layout_cache_dir: if given, graphviz layouts are cached there by subgraph,
+                             variants of a subgraph with other names or edge types don't run sfdp;
+    :param metrics_path: if given, every stage is timed, node and edge counts are collected
+                         (see metrics.Metrics), shown in the progress bar and written
+                         to this file at the end, as csv if it ends with .csv, as json otherwise;
+    :param profiler: if given, called as profiler(stage, seconds) for every timed stage,
+                     it turns the timing on too;
+    :param augmentations: number of variants derived in memory from every accepted sample
+                          (see augment.augment_sample), they are written next to it;
+    :param manifest_path: if given, every sample is logged there once written (see manifest.RunManifest),
+                          so that a stopped run started again with the same path resumes:
+                          logged samples are skipped, files of unlogged ones are removed.
+                          Started with a greater n it tops the data up to n samples.
+                          The seed and the file prefix are taken from the manifest, the sample sources
+                          (areas, bbox) and the other settings the samples depend on must be the logged ones,
+                          output="files" only.
+    :return: samples are written to the file-system;
+             number of accepted samples and of rejected ones per reason is returned,
+             augmented variants aren't counted.
     """
+    if renderer not in RENDERERS:
+        raise ValueError(f"Unknown renderer '{renderer}', expected one of {RENDERERS}.")
+    if manifest_path is not None and output != "files":
+        raise ValueError(f"A run manifest is only kept for output='files', not for '{output}'.")
+    manifest = RunManifest(manifest_path) if manifest_path is not None else None
+    if seed is None:
+        seed = manifest.header["seed"] if manifest is not None and manifest.header is not None \
+            else random.randrange(2 ** 32)
+
+    time_str = time.strftime("%Y%m%d_%H%M%S")
+    working_dir = "data"
+    file_prefix = "graph_" + time_str + "_"
+    areas = list(areas)
+    if manifest is not None:
+        # a resumed run goes on with the samples of the logged one,
+        # they are only reproduced from the same sources and the same dedupe index
+        settings = {"seed": seed, "keep_largest_component": keep_largest_component,
+                    "renderer": renderer, "augmentations": augmentations,
+                    "areas": areas, "bbox": bbox,
+                    "max_repeats": max_repeats, "graph_index_path": graph_index_path}
+        try:
+            header = manifest.start(settings, initial={"file_prefix": file_prefix})
+        except ValueError:
+            manifest.close()
+            raise
+        file_prefix = header["file_prefix"]
+        removed = remove_partial_samples(working_dir, file_prefix, manifest)
+        if len(manifest) or removed:
+            print(f"{len(manifest)} samples ({manifest.accepted} accepted) are already in {manifest_path}, "
+                  f"{len(removed)} files of unfinished samples are removed")
+
+    extract_path = get_merged_extract_path(areas, bbox, offline=offline)
+    # indexes and seeds are built (once per extract) before the workers start
+    spatial_index, _ = load_indexes(extract_path)
+    seed_positions = load_seed_positions(extract_path, MIN_NUMBER_OF_NODES)
+    if not len(seed_positions):
+        raise ValueError(f"No node of the extract has more than {MIN_NUMBER_OF_NODES} nodes around it.")
+    print(f"{len(spatial_index) - len(seed_positions)} of {len(spatial_index)} nodes "
+          f"are too sparse to be neighbourhood centres and are skipped")
+
+    # per-file output is written right in the workers,
+    # shards are appended to by the main process only
+    if output == "files":
+        writer, worker_output_dir = FileWriter(working_dir), working_dir
+    elif output == "shards":
+        writer, worker_output_dir = ShardWriter(os.path.join(working_dir, file_prefix),
+                                                samples_per_shard), None
+    else:
+        raise ValueError(f"Unknown output '{output}', expected 'files' or 'shards'.")
+
+    # duplicates are found in the main process, in the sample number order
+    graph_index = GraphIndex(graph_index_path, max_repeats or 1) \
+        if max_repeats is not None or graph_index_path is not None else None
+
+    stats = Counter()
+    collect_metrics = metrics_path is not None or profiler is not None
+    metrics = Metrics(profiler) if collect_metrics else NULL_METRICS
+    worker_args = (extract_path, worker_output_dir, collect_metrics, layout_cache_dir, augmentations)
+    pool = Pool(workers, initializer=_init_worker, initargs=worker_args) \
+        if workers > 1 else nullcontext()
+
+    with writer, pool, manifest or nullcontext():
+        if workers > 1:
+            def run(func: Callable, tasks: list[tuple]) -> Iterable:
+                return pool.imap_unordered(func, tasks, chunksize=max(1, len(tasks) // (workers * 16)))
+        else:
+            _init_worker(*worker_args)
+            run = map
 
-    ways, nodes = query_from_OSM(area='Москва')
+        screen_args = (seed, keep_largest_component, run, stats, metrics, graph_index, file_prefix)
+        if until_accepted:
+            sample_nums = _screen_until_accepted(n, *screen_args)
+        elif graph_index is not None:
+            sample_nums, _ = _screen_round(range(n), *screen_args)
+        else:
+            sample_nums = range(n)
 
-    for i in tqdm(range(n)):
-        neighbours = get_nodes_in_neighbourhood(nodes)
-        adj_list = create_adj_list(ways, neighbours)
+        if manifest is not None:
+            sample_nums = [i for i in sample_nums if i not in manifest]
+        is_screened = until_accepted or graph_index is not None
+        tasks = [(i, seed, file_prefix, keep_largest_component, renderer, is_screened) for i in sample_nums]
+        if manifest is not None and not is_screened:
+            # rejections of the logged samples are counted as if they were sampled again
+            stats.update(record.get("rejection", "accepted") for record in manifest.samples.values()
+                         if record["sample"] < n)
+        _track_progress(run(_generate_task, tasks), len(tasks), writer, metrics,
+                        None if is_screened else stats, manifest, seed)
 
-        time_str = time.strftime("%Y%m%d_%H%M%S")
-        working_dir = "data"
-        file_prefix = "graph_" + time_str + "_"
+    if graph_index is not None:
+        graph_index.save()
+    _report(stats)
+    if metrics_path is not None:
+        metrics.write(metrics_path, stats)
+    return dict(stats)
 
-        filepath = os.path.join(working_dir, file_prefix)
 
-        if MAX_NUMBER_OF_NODES > len(adj_list) > MIN_NUMBER_OF_NODES:
+def _task_metrics() -> Union[Metrics, NullMetrics]:
+    return Metrics() if _worker_state["collect_metrics"] else NULL_METRICS
+
+
+def _screen_task(task: tuple) -> Tuple[int, Optional[Rejection], Optional[str], Optional[dict]]:
+    sample_num, seed, keep_largest_component = task
+    metrics = _task_metrics()
+    _, rejection, topology = sample_graph(sample_num, seed, keep_largest_component, metrics)
+    return sample_num, rejection, topology, metrics.to_dict()
+
+
+def _screen_round(sample_nums: Iterable[int], seed: int, keep_largest_component: bool,
+                  run: Callable, stats: Counter,
+                  metrics: Union[Metrics, NullMetrics],
+                  graph_index: Optional[GraphIndex],
+                  file_prefix: str,
+                  limit: Optional[int] = None) -> Tuple[list[int], int]:
+    """
+    Screens the graphs of the given samples without drawing them.
+    Results are taken in the sample number order, so that duplicates and the limit
+    don't depend on the number of workers. Results past the limit are dropped,
+    they are neither counted in stats nor merged into metrics.
+
+    :param sample_nums: numbers of the samples to screen;
+    :param seed: seed of the run;
+    :param keep_largest_component: see sample_graph;
+    :param run: map-like function, runs tasks in the worker(s);
+    :param stats: accepted/rejected counters, updated in place;
+    :param metrics: metrics of the tasks are merged there;
+    :param graph_index: if given, subgraphs repeated too often are rejected as duplicates;
+    :param file_prefix: name prefix shared by all the samples of the run;
+    :param limit: if given, screening stops after this many samples are accepted.
+    :return: numbers of the accepted samples, ascending
+             + number of the screened samples taken before the limit, accepted or not.
+    """
+    tasks = [(i, seed, keep_largest_component) for i in sample_nums]
+    results = sorted(tqdm(run(_screen_task, tasks), total=len(tasks), desc="screening", leave=False),
+                     key=lambda result: result[0])
+
+    accepted = []
+    taken = 0
+    for sample_num, rejection, topology, task_metrics in results:
+        if limit is not None and len(accepted) >= limit:
+            break
+        if rejection is None and graph_index is not None \
+                and not graph_index.add(topology, file_prefix + str(sample_num)):
+            rejection = Rejection.DUPLICATE
+        if rejection is None:
+            accepted.append(sample_num)
+        stats[rejection.value if rejection is not None else "accepted"] += 1
+        metrics.merge(task_metrics)
+        taken += 1
+    return accepted, taken
 
-            filepath_cur = filepath + str(i)
 
-            if is_connected(adj_list):
-                pos_info = draw_graph(filepath_cur, adj_list)
+def _screen_until_accepted(n: int, seed: int, keep_largest_component: bool,
+                           run: Callable, stats: Counter,
+                           metrics: Union[Metrics, NullMetrics],
+                           graph_index: Optional[GraphIndex],
+                           file_prefix: str) -> list[int]:
+    """
+    Screens graphs in rounds sized by the acceptance rate seen so far,
+    until n of them are accepted.
+
+    :param n: number of samples to accept;
+    :param seed: seed of the run;
+    :param keep_largest_component: see sample_graph;
+    :param run: map-like function, runs tasks in the worker(s);
+    :param stats: accepted/rejected counters, updated in place;
+    :param metrics: metrics of the tasks are merged there;
+    :param graph_index: if given, subgraphs repeated too often are rejected as duplicates;
+    :param file_prefix: name prefix shared by all the samples of the run.
+    :return: numbers of the first n accepted samples, so that the result
+             doesn't depend on the number of workers.
+    """
+    accepted = []
+    attempted = 0
+    progress = tqdm(total=n, desc="accepted")
+
+    while len(accepted) < n:
+        if attempted >= n * MAX_ATTEMPTS_PER_SAMPLE:
+            raise RuntimeError(f"Only {len(accepted)} of {attempted} samples were accepted, "
+                               f"acceptance rate is too low to get {n} samples.")
+        if accepted:
+            acceptance_rate = len(accepted) / attempted
+        elif attempted:
+            acceptance_rate = 1 / MAX_ATTEMPTS_PER_SAMPLE
+        else:
+            acceptance_rate = 1.0
+        round_size = math.ceil(1.1 * (n - len(accepted)) / acceptance_rate)
+        round_size = min(round_size, n * MAX_ATTEMPTS_PER_SAMPLE - attempted)
+
+        round_accepted, taken = _screen_round(range(attempted, attempted + round_size),
+                                              seed, keep_largest_component, run, stats, metrics,
+                                              graph_index, file_prefix, limit=n - len(accepted))
+        accepted.extend(round_accepted)
+        # samples past the limit aren't counted, the stats and the metrics don't have them either
+        attempted += taken
+        progress.update(len(round_accepted))
+        progress.set_postfix(attempted=attempted, **_rejection_postfix(stats, metrics),
+                             **metrics.postfix(), refresh=False)
+
+    progress.close()
+    return accepted
+
+
+def _generate_task(task: tuple) \
+        -> Tuple[int, Optional[Rejection], Optional[str], list[Sample], list[str], Optional[dict]]:
+    """
+    :return: number of the sample + the reason to reject it + its topology hash
+             + the sample and its variants if the caller has to write them + names of all of them
+             + metrics of the task if they are collected.
+    """
+    metrics = _task_metrics()
+    rejection, sample, topology = generate_sample(*task, metrics=metrics)
+    samples = [sample] if sample is not None else []
+    if sample is not None and _worker_state["augmentations"]:
+        sample_num, seed = task[:2]
+        with metrics.stage("augment"):
+            samples.extend(augment_sample(sample, _worker_state["augmentations"], sample_seed(seed, sample_num)))
+    names = [sample.name for sample in samples]
+    if samples and _worker_state["writer"] is not None:
+        with metrics.stage("write"):
+            for sample in samples:
+                _worker_state["writer"].add(sample)
+        samples = []
+    return task[0], rejection, topology, samples, names, metrics.to_dict()
+
+
+def _track_progress(results, n: int, writer: Union[FileWriter, ShardWriter],
+                    metrics: Union[Metrics, NullMetrics],
+                    stats: Optional[Counter] = None,
+                    manifest: Optional[RunManifest] = None,
+                    seed: Optional[int] = None) -> None:
+    progress = tqdm(results, total=n)
+    accepted = 0
+    for sample_num, rejection, topology, samples, names, task_metrics in progress:
+        accepted += rejection is None
+        if stats is not None:
+            stats[rejection.value if rejection is not None else "accepted"] += 1
+        metrics.merge(task_metrics)
+        if samples:
+            with metrics.stage("write"):
+                for sample in samples:
+                    writer.add(sample)
+        # a sample is logged only after all of its files are written
+        if manifest is not None:
+            manifest.add(sample_num, sample_seed(seed, sample_num), topology, names,
+                         [path for name in names for path in writer.paths(name)],
+                         rejection.value if rejection is not None else None)
+        progress.set_postfix(accepted=accepted, **_rejection_postfix(stats, metrics),
+                             **metrics.postfix(), refresh=False)
+
+
+def _rejection_postfix(stats: Optional[Counter], metrics: Union[Metrics, NullMetrics]) -> dict[str: int]:
+    """
+    :return: rejected samples per reason, only if metrics are collected.
+    """
+    if not metrics.enabled or stats is None:
+        return {}
+    return {rejection.name.lower(): stats[rejection.value] for rejection in Rejection}
 
-                node_bboxes = obtain_node_bboxes(filepath_cur, pos_info, True)
-                edge_bboxes = obtain_edge_bboxes(filepath_cur, adj_list, pos_info)
 
-                data_to_pickle(filepath_cur, adj_list)
-                COCO_annotate_image(filepath_cur, node_bboxes, edge_bboxes)
+def _report(stats: Counter) -> None:
+    attempted = sum(stats.values())
+    for reason in ["accepted", *(rejection.value for rejection in Rejection)]:
+        share = stats[reason] / attempted if attempted else 0.0
+        print(f"{reason}: {stats[reason]} ({share:.1%})")
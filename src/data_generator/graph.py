@@ -0,0 +1,129 @@
+from typing import Iterable, Union, Tuple
+import numpy as np
+
+
+class Graph:
+    """
+    Compact undirected graph the generator passes around instead of adjacency-list dicts:
+    nodes are numbered, their labels are in one array, every undirected edge is stored once
+    as a pair of node numbers with a uint8 type column (CategoryId values).
+
+    The adjacency list of the README, ex.: {'R2': {'D2': {'weight': '1', 'type': 2}, ...}, ...},
+    is only built at the boundary (see to_adj_list).
+    """
+    __slots__ = ("labels", "edges", "types", "_csr")
+
+    def __init__(self, labels: Iterable[str], edges: np.ndarray, types: np.ndarray):
+        """
+        :param labels: node labels, ex.: "R2", the position of a label is the node number;
+        :param edges: (E, 2) array of node numbers, every undirected edge once;
+        :param types: (E,) array of the edge types.
+        """
+        self.labels = np.array(list(labels), dtype=str)
+        self.edges = np.asarray(edges, dtype=np.int32).reshape(-1, 2)
+        self.types = np.asarray(types, dtype=np.uint8).reshape(-1)
+        self._csr = None
+
+    @classmethod
+    def from_edge_list(cls, labels: Iterable[str], edges: np.ndarray, types: Iterable[int]) -> 'Graph':
+        """
+        Builds the graph as the adjacency list would be filled in edge by edge:
+        an edge may come several times in any direction, it keeps the place and the direction
+        of its first occurrence and the type of its last one.
+
+        :param labels: node labels, the position of a label is the node number;
+        :param edges: (E, 2) array of node numbers;
+        :param types: (E,) edge types.
+        """
+        labels = list(labels)
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        types = np.asarray(types, dtype=np.int64).reshape(-1)
+
+        pairs = np.sort(edges, axis=1)
+        keys = pairs[:, 0] * max(len(labels), 1) + pairs[:, 1]
+        _, first = np.unique(keys, return_index=True)
+        _, last_reversed = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last_reversed
+
+        order = np.argsort(first, kind="stable")
+        return cls(labels, edges[first[order]], types[last[order]])
+
+    @classmethod
+    def from_adj_list(cls, graph_adj_list: dict[str: dict[str: dict[str: Union[str, int]]]]) -> 'Graph':
+        """
+        :param graph_adj_list: adjacency-list represented graph, an edge may be listed
+                               in one direction or in both, ex.: a pickled sample.
+        """
+        node_num = {}
+        edges, types = [], []
+        for node_1, node_adj_list in graph_adj_list.items():
+            num_1 = node_num.setdefault(node_1, len(node_num))
+            for node_2, info in node_adj_list.items():
+                edges.append((num_1, node_num.setdefault(node_2, len(node_num))))
+                types.append(int(info["type"]))
+        return cls.from_edge_list(node_num.keys(), edges, types)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edges)
+
+    # samples are sent between processes, raw buffers pickle smaller than arrays
+    def __getstate__(self) -> tuple:
+        return self.labels.tolist(), self.edges.tobytes(), self.types.tobytes()
+
+    def __setstate__(self, state: tuple) -> None:
+        labels, edges, types = state
+        self.labels = np.array(labels, dtype=str)
+        self.edges = np.frombuffer(edges, dtype=np.int32).reshape(-1, 2)
+        self.types = np.frombuffer(types, dtype=np.uint8)
+        self._csr = None
+
+    def csr(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Adjacency in compressed sparse rows, built on first use:
+        neighbours of node i are indices[indptr[i]:indptr[i + 1]], in the edge order.
+
+        :return: (N + 1,) indptr + (2E,) indices + (2E,) numbers of the edges leading to the indices.
+        """
+        if self._csr is None:
+            edge_ids = np.tile(np.arange(len(self.edges), dtype=np.int64), 2)
+            src = np.concatenate([self.edges[:, 0], self.edges[:, 1]]).astype(np.int64)
+            dst = np.concatenate([self.edges[:, 1], self.edges[:, 0]]).astype(np.int64)
+            order = np.lexsort((edge_ids, src))
+
+            indptr = np.zeros(len(self.labels) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(src, minlength=len(self.labels)), out=indptr[1:])
+            self._csr = indptr, dst[order], edge_ids[order]
+        return self._csr
+
+    def edge_index(self, names: list[str]) -> np.ndarray:
+        """
+        :param names: node labels in another order, ex.: the order of a node positioning info.
+        :return: (E, 2) array of the edges, nodes are numbered by their position in names.
+        """
+        position = {name: num for num, name in enumerate(names)}
+        renumber = np.array([position[label] for label in self.labels.tolist()], dtype=np.int64)
+        return renumber[self.edges].reshape(-1, 2)
+
+    def to_adj_list(self) -> dict[str: dict[str: dict[str: Union[str, int]]]]:
+        """
+        Builds the adjacency list of the README, both directions of every edge are listed,
+        every edge direction gets its own {"type": ..., "weight": "1"}.
+
+        :return: adjacency-list represented graph,
+                 ex.: {'R2': {'D2': {'weight': '1', 'type': 2}, ...}, ...}.
+                 Weight isn't used and is always '1', we keep it to satisfy Problem API.
+        """
+        indptr, indices, edge_ids = self.csr()
+        labels, types = self.labels.tolist(), self.types.tolist()
+        neighbours, neighbour_types = indices.tolist(), [types[edge_id] for edge_id in edge_ids.tolist()]
+
+        adj_list = {}
+        for node, (start, end) in enumerate(zip(indptr[:-1].tolist(), indptr[1:].tolist())):
+            adj_list[labels[node]] = {
+                labels[neighbour]: {"type": edge_type, "weight": "1"}
+                for neighbour, edge_type in zip(neighbours[start:end], neighbour_types[start:end])}
+        return adj_list
@@ -2,4 +2,4 @@ from src.data_generator.generator import generate_data
 
 
 if __name__ == "__main__":
-    generate_data(n=1500)
+    generate_data(n=1500, manifest_path="data/manifest.jsonl")
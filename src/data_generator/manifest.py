@@ -0,0 +1,147 @@
+from src.data_generator.writers import SAMPLE_FILE_SUFFIXES
+from typing import Iterable, Optional
+import json
+import os
+
+
+class RunManifest:
+    """
+    Append-only log of a generation run, one json line per sample:
+    the first line holds the settings of the run, every next one the outcome of a sample -
+    its number, seed, topology hash (see dedupe.topology_hash) and written files,
+    or the reason it was rejected.
+
+    A line is appended by a single write once all the files of the sample are written,
+    so a crashed run leaves at most a cut last line, which is dropped on reading.
+    A restarted run skips the samples listed here.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: jsonl file of the manifest, it is read if it exists.
+        """
+        self.path = path
+        self.header: Optional[dict] = None
+        self.samples = {}  # sample number -> its line
+
+        if os.path.isfile(path):
+            self._read()
+        self._fd = None
+
+    def _read(self) -> None:
+        valid_size = 0
+        with open(self.path, "rb") as fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                valid_size += len(line)
+                if self.header is None:
+                    self.header = record
+                else:
+                    self.samples[record["sample"]] = record
+        # the cut line of a crashed run must not prefix the next appended one
+        if valid_size != os.path.getsize(self.path):
+            os.truncate(self.path, valid_size)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def __contains__(self, sample_num: int) -> bool:
+        return sample_num in self.samples
+
+    @property
+    def accepted(self) -> int:
+        return sum(record.get("rejection") is None for record in self.samples.values())
+
+    def names(self) -> set[str]:
+        """
+        :return: names of the samples whose files are all written.
+        """
+        return {name for record in self.samples.values() for name in record.get("names", ())}
+
+    def _append(self, record: dict) -> None:
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        os.write(self._fd, (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def start(self, settings: dict, initial: Optional[dict] = None) -> dict:
+        """
+        :param settings: settings of the run, json-serializable, ex.: seed and sample sources,
+                         a resumed run must have the recorded ones;
+        :param initial: settings only the first run records, the next ones take the recorded values,
+                        ex.: file prefix.
+        :return: all the settings of the run, the recorded ones if the manifest already has them.
+        :raise ValueError: if the settings differ from the recorded ones.
+        """
+        # as they are read back, ex.: tuples become lists
+        settings = json.loads(json.dumps(settings, ensure_ascii=False))
+        if self.header is None:
+            self.header = {**settings, **(initial or {})}
+            self._append(self.header)
+        changed = [key for key, value in settings.items() if self.header.get(key) != value]
+        if changed:
+            raise ValueError(f"Settings of the run differ from the ones in the manifest {self.path}: "
+                             f"{', '.join(changed)}.")
+        return self.header
+
+    def add(self, sample_num: int, seed: int, topology: Optional[str],
+            names: Iterable[str] = (), paths: Iterable[str] = (),
+            rejection: Optional[str] = None) -> None:
+        """
+        Records the outcome of a sample, call it once its files are written.
+
+        :param sample_num: number of the sample in the run;
+        :param seed: seed of the sample (see generator.sample_seed);
+        :param topology: topology hash of the sampled graph, None if it was rejected before hashing;
+        :param names: names of the written sample and of its variants;
+        :param paths: written files;
+        :param rejection: the reason the sample was rejected, None if it was accepted.
+        """
+        record = {"sample": sample_num, "seed": seed, "topology": topology,
+                  "names": list(names), "paths": list(paths)}
+        if rejection is not None:
+            record["rejection"] = rejection
+        self._append(record)
+        self.samples[sample_num] = record
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> 'RunManifest':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def remove_partial_samples(output_dir: str, file_prefix: str, manifest: RunManifest) -> list[str]:
+    """
+    Removes the files of the run's samples that aren't in the manifest,
+    they were being written when the run stopped.
+
+    :param output_dir: directory the run writes samples to;
+    :param file_prefix: name prefix shared by all the samples of the run;
+    :param manifest: manifest of the run.
+    :return: removed files.
+    """
+    if not os.path.isdir(output_dir):
+        return []
+    complete = manifest.names()
+    removed = []
+    for file_name in os.listdir(output_dir):
+        if not file_name.startswith(file_prefix):
+            continue
+        for suffix in SAMPLE_FILE_SUFFIXES:
+            if file_name.endswith(suffix):
+                name = file_name[:-len(suffix)]
+                if name not in complete:
+                    os.remove(os.path.join(output_dir, file_name))
+                    removed.append(file_name)
+                break
+    return removed
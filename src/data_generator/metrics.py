@@ -0,0 +1,147 @@
+from src.data_generator.graph import Graph
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Optional
+import time
+import json
+import csv
+
+# Stages of generate_sample, in pipeline order.
+# "resample" - sampling a graph again to draw it, after screening timed its first sampling.
+STAGES = ("sampling", "adjacency", "connectivity", "resample", "layout", "render", "bbox", "augment", "write")
+
+
+class Metrics:
+    """
+    Opt-in instrumentation of the generation pipeline:
+    total time of every stage, histograms of node and edge counts of accepted graphs.
+
+    Worker processes fill a Metrics per task and send it back as a dict,
+    the main process merges them (see merge).
+    """
+    enabled = True
+
+    def __init__(self, profiler: Optional[Callable[[str, float], None]] = None):
+        """
+        :param profiler: called as profiler(stage, seconds) after every timed stage.
+                         Samples made in worker processes are reported once they are merged
+                         in the main process, so the callback doesn't have to be picklable.
+        """
+        self.profiler = profiler
+        self.total_s = defaultdict(float)
+        self.calls = Counter()
+        self.nodes = Counter()
+        self.edges = Counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times the body of the with-statement as the stage.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.total_s[name] += seconds
+        self.calls[name] += 1
+        if self.profiler is not None:
+            self.profiler(name, seconds)
+
+    def count_graph(self, graph: Graph) -> None:
+        """
+        Adds an accepted graph to the node and edge count histograms.
+        """
+        self.nodes[len(graph)] += 1
+        self.edges[graph.n_edges] += 1
+
+    def to_dict(self) -> dict:
+        return {"total_s": dict(self.total_s), "calls": dict(self.calls),
+                "nodes": dict(self.nodes), "edges": dict(self.edges)}
+
+    def merge(self, other: Optional[dict]) -> None:
+        """
+        :param other: to_dict() of the metrics of a task, None is ignored.
+        """
+        if other is None:
+            return
+        for name, seconds in other["total_s"].items():
+            self.total_s[name] += seconds
+            self.calls[name] += other["calls"][name]
+            if self.profiler is not None:
+                self.profiler(name, seconds)
+        self.nodes.update(other["nodes"])
+        self.edges.update(other["edges"])
+
+    def postfix(self) -> dict[str: str]:
+        """
+        :return: mean milliseconds per call of every stage, for the tqdm postfix.
+        """
+        return {name: f"{1e3 * self.total_s[name] / self.calls[name]:.1f}ms"
+                for name in STAGES if self.calls[name]}
+
+    def summary(self, outcomes: Optional[Counter] = None) -> dict:
+        """
+        :param outcomes: number of accepted samples and of rejected ones per reason.
+        :return: everything collected, json-serializable.
+        """
+        return {"stages": {name: {"calls": self.calls[name],
+                                  "total_s": self.total_s[name],
+                                  "mean_ms": 1e3 * self.total_s[name] / self.calls[name]}
+                           for name in self.total_s},
+                "outcomes": dict(outcomes or {}),
+                "nodes": dict(sorted(self.nodes.items())),
+                "edges": dict(sorted(self.edges.items()))}
+
+    def write(self, path: str, outcomes: Optional[Counter] = None) -> None:
+        """
+        Writes the summary as json, or as csv if the path ends with .csv.
+
+        :param path: file to write to;
+        :param outcomes: number of accepted samples and of rejected ones per reason.
+        """
+        summary = self.summary(outcomes)
+        if not path.endswith(".csv"):
+            with open(path, "w") as fp:
+                json.dump(summary, fp, indent=2)
+            return
+
+        with open(path, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["section", "key", "value", "calls", "mean_ms"])
+            for name, stage in summary["stages"].items():
+                writer.writerow(["stage", name, stage["total_s"], stage["calls"], stage["mean_ms"]])
+            for section in ("outcomes", "nodes", "edges"):
+                for key, value in summary[section].items():
+                    writer.writerow([section, key, value, "", ""])
+
+
+class NullMetrics:
+    """
+    Disabled instrumentation, every call is a no-op.
+    """
+    enabled = False
+    _null_stage = nullcontext()
+
+    def stage(self, name: str):
+        return self._null_stage
+
+    def add_time(self, name: str, seconds: float) -> None:
+        pass
+
+    def count_graph(self, graph) -> None:
+        pass
+
+    def to_dict(self) -> None:
+        return None
+
+    def merge(self, other: Optional[dict]) -> None:
+        pass
+
+    def postfix(self) -> dict[str: str]:
+        return {}
+
+
+NULL_METRICS = NullMetrics()
@@ -0,0 +1,197 @@
+from src.data_generator.osm_stream import columns_from_stream, CHUNK_SIZE
+from typing import NamedTuple, Optional, Iterable, Tuple, TextIO
+import numpy as np
+import requests
+import urllib3
+import hashlib
+import shutil
+import json
+import io
+import os
+
+CACHE_DIR = "osm_cache"
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+# seconds to wait for the next bytes of the response
+OVERPASS_READ_TIMEOUT = 180
+
+
+class OSMExtract(NamedTuple):
+    """
+    Columnar OSM extract: everything the sampler needs and nothing else.
+
+    Nodes are kept as aligned id/lat/lon columns, ways as CSR arrays:
+    nodes of the i-th way are way_nodes[way_ptr[i]:way_ptr[i + 1]].
+    """
+    node_ids: np.ndarray  # int64
+    lat: np.ndarray  # float64
+    lon: np.ndarray  # float64
+    way_ids: np.ndarray  # int64
+    way_ptr: np.ndarray  # int64, len(way_ids) + 1
+    way_nodes: np.ndarray  # int64
+
+
+def build_query(area: str) -> str:
+    """
+    :param area: name of the area in OSM, ex.: 'Москва'.
+    :return: Overpass query for all the paths in the area.
+    """
+    # OSM query language is very wierd, it is what it is:
+    return f'area[name="{area}"];' \
+           f'way(area)[highway=path];' \
+           f'(._;>;);'
+
+
+def cache_path(area: str, query: str, cache_dir: str = CACHE_DIR) -> str:
+    """
+    :param area: name of the area in OSM;
+    :param query: Overpass query the extract is made of;
+    :param cache_dir: directory with all the cached extracts.
+    :return: directory of the cached extract for this area and query.
+    """
+    key = hashlib.sha1(f"{area}\n{query}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, key)
+
+
+def extract_from_stream(fp: TextIO, chunk_size: int = CHUNK_SIZE) -> OSMExtract:
+    """
+    Converts the Overpass json response to the columnar format as it is read,
+    the whole response is never in memory.
+
+    :param fp: text stream of the response: an opened saved response or an HTTP stream;
+    :param chunk_size: characters read at once.
+    :return: columnar extract.
+    """
+    return OSMExtract(**columns_from_stream(fp, chunk_size))
+
+
+def extract_from_response_file(path: str, chunk_size: int = CHUNK_SIZE) -> OSMExtract:
+    """
+    :param path: Overpass json response saved to a file, ex.: a fixture of the benchmarks;
+    :param chunk_size: characters read at once.
+    :return: columnar extract.
+    """
+    with open(path, encoding="utf-8") as fp:
+        return extract_from_stream(fp, chunk_size)
+
+
+def overpass_ql(query: str) -> str:
+    """
+    :param query: Overpass query, ex.: build_query(area).
+    :return: complete request with json output, as the Overpass API interpreter takes it.
+    """
+    return f"[out:json];{query}out body;"
+
+
+def fetch_extract(query: str,
+                  url: str = OVERPASS_URL,
+                  chunk_size: int = CHUNK_SIZE,
+                  session: Optional[requests.Session] = None) -> OSMExtract:
+    """
+    Queries Overpass and converts the response while it is being downloaded.
+
+    :param query: Overpass query, ex.: build_query(area);
+    :param url: Overpass API interpreter endpoint;
+    :param chunk_size: characters read at once;
+    :param session: requests session to reuse its connections, a new connection if not given.
+    :return: columnar extract.
+    :raise requests.RequestException: if the request fails or the connection breaks during the download;
+    :raise ValueError: if the response is incomplete (see osm_stream.iter_element_texts).
+    """
+    post = session.post if session is not None else requests.post
+    with post(url, data={"data": overpass_ql(query)}, stream=True,
+              timeout=(10, OVERPASS_READ_TIMEOUT)) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        # the response is read to its end (see osm_stream.iter_element_texts),
+        # a closed raw stream would fail TextIOWrapper there
+        response.raw.auto_close = False
+        try:
+            return extract_from_stream(io.TextIOWrapper(response.raw, encoding="utf-8"), chunk_size)
+        except urllib3.exceptions.ProtocolError as error:
+            # the raw stream isn't wrapped by requests, its errors are raised as iter_content raises them
+            raise requests.exceptions.ChunkedEncodingError(error) from error
+
+
+def save_arrays(path: str, arrays: dict[str: np.ndarray], meta: Optional[dict] = None) -> None:
+    """
+    Writes arrays as a directory of .npy files.
+    The directory appears atomically, so a crashed run never leaves a half-written cache.
+
+    :param path: directory to write the arrays to;
+    :param arrays: name -> array;
+    :param meta: anything json-serializable to keep next to the arrays.
+    """
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), np.ascontiguousarray(array))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as fp:
+        json.dump(meta or {}, fp, ensure_ascii=False)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def load_arrays(path: str, names: Iterable[str], mmap_mode: Optional[str] = "r") \
+        -> Tuple[list[np.ndarray], dict]:
+    """
+    Reads arrays written by save_arrays.
+
+    :param path: directory of the arrays;
+    :param names: names of the arrays to read;
+    :param mmap_mode: np.load memory-map mode, by default arrays are mapped
+                      read-only, so worker processes share the page cache.
+    :return: arrays in the order of names + meta.
+    """
+    arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode) for name in names]
+    with open(os.path.join(path, "meta.json")) as fp:
+        meta = json.load(fp)
+    return arrays, meta
+
+
+def save_extract(path: str, extract: OSMExtract, meta: Optional[dict] = None) -> None:
+    """
+    Writes the extract as a directory of .npy files.
+
+    :param path: directory to write the extract to;
+    :param extract: columnar extract;
+    :param meta: anything json-serializable to keep next to the arrays, ex.: area and query.
+    """
+    save_arrays(path, extract._asdict(), meta)
+
+
+def load_extract(path: str, mmap_mode: Optional[str] = "r") -> OSMExtract:
+    """
+    Reads the extract written by save_extract.
+
+    :param path: directory of the extract;
+    :param mmap_mode: np.load memory-map mode.
+    :return: columnar extract.
+    """
+    arrays, _ = load_arrays(path, OSMExtract._fields, mmap_mode)
+    return OSMExtract(*arrays)
+
+
+def get_OSM_extract_path(area: str = 'Москва',
+                         cache_dir: str = CACHE_DIR,
+                         offline: bool = False) -> str:
+    """
+    Makes sure paths of the area are in the local cache, queries OSM only on a cache miss.
+
+    :param area: name of the area in OSM;
+    :param cache_dir: directory with all the cached extracts;
+    :param offline: never query OSM, fail if the area isn't cached.
+    :return: directory of the cached extract.
+    """
+    query = build_query(area)
+    path = cache_path(area, query, cache_dir)
+
+    if not os.path.isdir(path):
+        if offline:
+            raise FileNotFoundError(f"No cached OSM extract for area '{area}' in {cache_dir}, "
+                                    f"offline mode forbids querying OSM.")
+        save_extract(path, fetch_extract(query), meta={"area": area, "query": query})
+
+    return path
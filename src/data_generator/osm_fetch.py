@@ -0,0 +1,225 @@
+from src.data_generator.osm_cache import OSMExtract, CACHE_DIR, OVERPASS_URL, \
+    build_query, \
+    cache_path, \
+    fetch_extract, \
+    save_extract, \
+    load_extract
+from src.data_generator.util import gather_ranges
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Tuple
+from requests.adapters import HTTPAdapter
+import numpy as np
+import threading
+import requests
+import hashlib
+import random
+import time
+import os
+
+# Concurrent requests, the public Overpass instance allows only a couple per client.
+MAX_CONCURRENT_REQUESTS = 2
+MAX_RETRIES = 5
+# seconds before the first retry, doubled on every next one
+BACKOFF = 2.0
+# side of a bounding-box tile in degrees
+TILE_SIZE = 0.05
+# HTTP statuses Overpass answers with when it is busy
+RETRY_STATUSES = (429, 502, 503, 504)
+
+# (south, west, north, east) in degrees
+BBox = Tuple[float, float, float, float]
+
+
+def build_bbox_query(bbox: BBox) -> str:
+    """
+    :param bbox: (south, west, north, east) in degrees.
+    :return: Overpass query for all the paths in the bounding box, as build_query does for an area.
+    """
+    south, west, north, east = bbox
+    return f'way({south},{west},{north},{east})[highway=path];' \
+           f'(._;>;);'
+
+
+def bbox_tiles(bbox: BBox, tile_size: float = TILE_SIZE) -> list[BBox]:
+    """
+    Splits a bounding box into tiles, so that each one is a small request.
+
+    :param bbox: (south, west, north, east) in degrees;
+    :param tile_size: side of a tile in degrees, tiles at the north and east borders are cut.
+    :return: tiles covering the bounding box, row by row.
+    """
+    south, west, north, east = bbox
+    lats = np.append(np.arange(south, north, tile_size), north)
+    lons = np.append(np.arange(west, east, tile_size), east)
+    return [(round(lat_1, 7), round(lon_1, 7), round(lat_2, 7), round(lon_2, 7))
+            for lat_1, lat_2 in zip(lats[:-1].tolist(), lats[1:].tolist())
+            for lon_1, lon_2 in zip(lons[:-1].tolist(), lons[1:].tolist())]
+
+
+def merge_extracts(extracts: Iterable[OSMExtract]) -> OSMExtract:
+    """
+    Joins extracts into one, nodes and ways present in several of them
+    (ex.: crossing tile borders) are kept once.
+
+    :param extracts: columnar extracts.
+    :return: columnar extract with unique node ids and way ids.
+    """
+    extracts = list(extracts)
+
+    node_ids = np.concatenate([extract.node_ids for extract in extracts])
+    node_ids, first_node = np.unique(node_ids, return_index=True)
+    lat = np.concatenate([extract.lat for extract in extracts])[first_node]
+    lon = np.concatenate([extract.lon for extract in extracts])[first_node]
+
+    # way_ptr of every extract is shifted by the way nodes of the extracts before it
+    node_offsets = np.cumsum([0] + [len(extract.way_nodes) for extract in extracts])
+    way_ids = np.concatenate([extract.way_ids for extract in extracts])
+    way_starts = np.concatenate([extract.way_ptr[:-1] + offset
+                                 for extract, offset in zip(extracts, node_offsets.tolist())])
+    way_lengths = np.concatenate([np.diff(extract.way_ptr) for extract in extracts])
+    all_way_nodes = np.concatenate([extract.way_nodes for extract in extracts])
+
+    way_ids, first_way = np.unique(way_ids, return_index=True)
+    way_lengths = way_lengths[first_way]
+    way_starts = way_starts[first_way]
+
+    way_ptr = np.zeros(len(way_ids) + 1, dtype=np.int64)
+    way_ptr[1:] = np.cumsum(way_lengths)
+    way_nodes = all_way_nodes[gather_ranges(way_starts, way_lengths)]
+
+    return OSMExtract(node_ids, lat, lon, way_ids, way_ptr, way_nodes)
+
+
+class TileFetcher:
+    """
+    Fetches Overpass queries with a bounded pool of threads.
+
+    Every thread keeps one requests session, so connections are reused.
+    Busy answers, connection errors and incomplete responses (cut, empty or with
+    an Overpass runtime error remark) are retried with exponential backoff.
+    Every fetched query is saved as an extract of its own once its response is parsed
+    to the end, so an interrupted fetch resumes from the queries that are not saved yet.
+    """
+
+    def __init__(self,
+                 url: str = OVERPASS_URL,
+                 max_workers: int = MAX_CONCURRENT_REQUESTS,
+                 max_retries: int = MAX_RETRIES,
+                 backoff: float = BACKOFF):
+        """
+        :param url: Overpass API interpreter endpoint, ex.: of a local stand-in (see overpass_stub);
+        :param max_workers: number of concurrent requests;
+        :param max_retries: attempts after the first failed one;
+        :param backoff: seconds before the first retry, doubled on every next one.
+        """
+        self.url = url
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_maxsize=1))
+            session.mount("https://", HTTPAdapter(pool_maxsize=1))
+            self._local.session = session
+        return self._local.session
+
+    def _fetch(self, job: Tuple[str, str]) -> str:
+        """
+        :param job: directory to save the extract to + Overpass query.
+        :return: directory of the saved extract of the query.
+        """
+        path, query = job
+        if os.path.isdir(path):
+            return path
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                extract = fetch_extract(query, self.url, session=self._session())
+                break
+            # ValueError: the response parsed so far is incomplete, nothing of it is saved
+            except (requests.RequestException, ValueError) as error:
+                status = error.response.status_code \
+                    if isinstance(error, requests.HTTPError) and error.response is not None else None
+                if attempt == self.max_retries or (status is not None and status not in RETRY_STATUSES):
+                    raise
+                # jitter keeps the workers from retrying in lockstep
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+        save_extract(path, extract, meta={"query": query})
+        return path
+
+    def fetch(self, jobs: Iterable[Tuple[str, str]]) -> list[str]:
+        """
+        :param jobs: directory to save the extract to + Overpass query, ex.: of the tiles of an area;
+                     queries whose directories exist are not fetched again.
+        :return: directories of the saved extracts, aligned with the jobs.
+        """
+        with ThreadPoolExecutor(self.max_workers) as executor:
+            return list(executor.map(self._fetch, jobs))
+
+
+def extract_jobs(areas: Iterable[str] = (), bbox: Optional[BBox] = None,
+                 tile_size: float = TILE_SIZE, cache_dir: str = CACHE_DIR) -> list[Tuple[str, str]]:
+    """
+    :param areas: names of areas in OSM, one query per area;
+    :param bbox: (south, west, north, east) in degrees, split into tiles of tile_size;
+    :param tile_size: side of a tile in degrees;
+    :param cache_dir: directory with all the cached extracts.
+    :return: cache directory + Overpass query of every area and tile.
+             An area is cached where get_OSM_extract_path caches it.
+    """
+    jobs = []
+    for area in areas:
+        query = build_query(area)
+        jobs.append((cache_path(area, query, cache_dir), query))
+    if bbox is not None:
+        for tile in bbox_tiles(bbox, tile_size):
+            query = build_bbox_query(tile)
+            key = hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+            jobs.append((os.path.join(cache_dir, "tiles", key), query))
+    return jobs
+
+
+def get_merged_extract_path(areas: Iterable[str] = ('Москва',),
+                            bbox: Optional[BBox] = None,
+                            tile_size: float = TILE_SIZE,
+                            cache_dir: str = CACHE_DIR,
+                            offline: bool = False,
+                            url: str = OVERPASS_URL,
+                            max_workers: int = MAX_CONCURRENT_REQUESTS) -> str:
+    """
+    Makes sure paths of all the areas and tiles are in the local cache as one merged extract,
+    queries OSM only for the areas and tiles that aren't cached yet.
+
+    :param areas: names of areas in OSM;
+    :param bbox: (south, west, north, east) in degrees, fetched tile by tile;
+    :param tile_size: side of a tile in degrees;
+    :param cache_dir: directory with all the cached extracts;
+    :param offline: never query OSM, fail if the merged extract isn't cached;
+    :param url: Overpass API interpreter endpoint, ex.: of a local stand-in (see overpass_stub);
+    :param max_workers: number of concurrent requests.
+    :return: directory of the cached merged extract.
+    """
+    jobs = extract_jobs(areas, bbox, tile_size, cache_dir)
+    if not jobs:
+        raise ValueError("Neither areas nor bbox are given.")
+
+    if len(jobs) == 1:
+        path = jobs[0][0]
+    else:
+        key = hashlib.sha1("\n".join(sorted(query for _, query in jobs)).encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(cache_dir, "merged_" + key)
+
+    if not os.path.isdir(path):
+        if offline:
+            raise FileNotFoundError(f"No cached OSM extract for {len(jobs)} areas and tiles in {cache_dir}, "
+                                    f"offline mode forbids querying OSM.")
+        extract_paths = TileFetcher(url, max_workers).fetch(jobs)
+        if len(jobs) > 1:
+            save_extract(path, merge_extracts(load_extract(extract_path) for extract_path in extract_paths),
+                         meta={"queries": [query for _, query in jobs]})
+
+    return path
@@ -0,0 +1,324 @@
+from src.data_generator.osm_cache import save_arrays, load_arrays, load_extract
+from src.data_generator.util import gather_ranges, grid_sort, grid_candidates
+from typing import Iterable, Union, Tuple
+import numpy as np
+import os
+
+# Half-side of the square neighbourhood in degrees,
+# it is also the side of a grid cell of the spatial index.
+NEIGHBOURHOOD_SIZE = 0.001
+# Number of neighbourhoods counted at once while looking for viable seeds.
+SEED_CHUNK_SIZE = 1 << 16
+
+
+class _ArrayBacked:
+    """
+    Persists an index as a directory of .npy files, so that worker processes
+    memory-map one shared copy instead of building their own.
+    """
+    _arrays: Tuple[str, ...] = ()
+    _scalars: Tuple[str, ...] = ()
+
+    def save(self, path: str) -> None:
+        """
+        :param path: directory to write the index to.
+        """
+        save_arrays(path,
+                    {name: getattr(self, name) for name in self._arrays},
+                    meta={name: getattr(self, name) for name in self._scalars})
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Union[str, None] = "r"):
+        """
+        :param path: directory the index was saved to;
+        :param mmap_mode: np.load memory-map mode.
+        :return: the index backed by (memory-mapped) arrays.
+        """
+        index = cls.__new__(cls)
+        arrays, meta = load_arrays(path, cls._arrays, mmap_mode)
+        for name, array in zip(cls._arrays, arrays):
+            setattr(index, name, array)
+        for name in cls._scalars:
+            setattr(index, name, meta[name])
+        return index
+
+
+class SpatialIndex(_ArrayBacked):
+    """
+    Uniform grid over OSM node coordinates.
+
+    Nodes are stored in NumPy arrays and sorted by the key of the grid cell
+    they fall into, so the nodes of any cell are found by a binary search
+    over the sorted keys. A square neighbourhood lookup only touches the
+    cells the square overlaps instead of every node of the city.
+    """
+    _arrays = ("ids", "lat", "lon", "order", "keys")
+    _scalars = ("cell_size", "lat_origin", "lon_origin", "n_cols")
+
+    def __init__(self,
+                 ids: Iterable[int],
+                 lat: Iterable[float],
+                 lon: Iterable[float],
+                 cell_size: float = NEIGHBOURHOOD_SIZE):
+        """
+        :param ids: OSM node ids;
+        :param lat: node latitudes, aligned with ids;
+        :param lon: node longitudes, aligned with ids;
+        :param cell_size: side of a grid cell in degrees.
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell_size = cell_size
+
+        self.lat_origin = float(self.lat.min()) if len(self.ids) else 0.0
+        self.lon_origin = float(self.lon.min()) if len(self.ids) else 0.0
+        self.order, self.keys, self.n_cols = grid_sort(*self._cells(self.lat, self.lon))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def locate(self, node_ids: Iterable[int]) -> np.ndarray:
+        """
+        :param node_ids: OSM node ids, all of them must be in the index.
+        :return: positions of the nodes in the index arrays.
+        """
+        # built lazily: only the native renderer needs coordinates of named nodes
+        if getattr(self, "_id_order", None) is None:
+            self._id_order = np.argsort(self.ids, kind="stable")
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        return self._id_order[np.searchsorted(self.ids, node_ids, sorter=self._id_order)]
+
+    def _cells(self, lat: np.ndarray, lon: np.ndarray):
+        rows = np.floor((lat - self.lat_origin) / self.cell_size).astype(np.int64)
+        cols = np.floor((lon - self.lon_origin) / self.cell_size).astype(np.int64)
+        return rows, cols
+
+    def _candidates(self, lat: np.ndarray, lon: np.ndarray, size: float):
+        """
+        Gathers positions of the nodes lying in the cells every query square overlaps.
+
+        :return: (query number, node position) pairs, grouped by query number.
+        """
+        rows, cols = self._cells(lat, lon)
+        return grid_candidates(self.order, self.keys, self.n_cols, rows, cols,
+                               reach=int(np.ceil(size / self.cell_size)))
+
+    def query_positions(self, lat: Union[float, np.ndarray], lon: Union[float, np.ndarray],
+                        size: float = NEIGHBOURHOOD_SIZE) -> list[np.ndarray]:
+        """
+        Answers a batch of square neighbourhood lookups in one vectorized call.
+
+        :param lat: latitudes of the square centres;
+        :param lon: longitudes of the square centres;
+        :param size: half-side of the square in degrees.
+        :return: for every centre - positions (in the index arrays) of nodes
+                 strictly inside its square, in ascending order.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+
+        query_ids, positions = self._candidates(lat, lon, size)
+        inside = (np.abs(self.lat[positions] - lat[query_ids]) < size) & \
+                 (np.abs(self.lon[positions] - lon[query_ids]) < size)
+        query_ids, positions = query_ids[inside], positions[inside]
+
+        # keep the original node order inside every neighbourhood
+        order = np.lexsort((positions, query_ids))
+        query_ids, positions = query_ids[order], positions[order]
+
+        splits = np.searchsorted(query_ids, np.arange(1, len(lat)))
+        return np.split(positions, splits)
+
+    def count_within(self, lat: Union[float, np.ndarray], lon: Union[float, np.ndarray],
+                     size: float = NEIGHBOURHOOD_SIZE,
+                     mask: Union[np.ndarray, None] = None) -> np.ndarray:
+        """
+        Counts nodes in a batch of square neighbourhoods without materializing them.
+
+        :param lat: latitudes of the square centres;
+        :param lon: longitudes of the square centres;
+        :param size: half-side of the square in degrees;
+        :param mask: if given, only nodes at positions where mask is True are counted.
+        :return: for every centre - number of (masked) nodes strictly inside its square.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+
+        query_ids, positions = self._candidates(lat, lon, size)
+        inside = (np.abs(self.lat[positions] - lat[query_ids]) < size) & \
+                 (np.abs(self.lon[positions] - lon[query_ids]) < size)
+        if mask is not None:
+            inside &= mask[positions]
+        return np.bincount(query_ids[inside], minlength=len(lat))
+
+    def query(self, lat: Union[float, np.ndarray], lon: Union[float, np.ndarray],
+              size: float = NEIGHBOURHOOD_SIZE) -> list[np.ndarray]:
+        """
+        Same as query_positions, but returns OSM node ids.
+
+        :param lat: latitudes of the square centres;
+        :param lon: longitudes of the square centres;
+        :param size: half-side of the square in degrees.
+        :return: for every centre - ids of nodes strictly inside its square.
+        """
+        return [self.ids[positions] for positions in self.query_positions(lat, lon, size)]
+
+
+class SegmentIndex(_ArrayBacked):
+    """
+    Table of way segments (pairs of consecutive way nodes) keyed by node id.
+
+    Every node id maps to the segments incident to it through a CSR layout
+    (indptr + incident), so the edges of a neighbourhood are collected from
+    the segments of its nodes only, not from all the ways of the city.
+    """
+    _arrays = ("node_a", "node_b", "node_ids", "incident", "indptr")
+
+    def __init__(self, node_a: Iterable[int], node_b: Iterable[int]):
+        """
+        :param node_a: first node id of every segment;
+        :param node_b: second node id of every segment, aligned with node_a.
+        """
+        node_a = np.asarray(node_a, dtype=np.int64)
+        node_b = np.asarray(node_b, dtype=np.int64)
+
+        # Several ways may share a segment and a way may pass it back and forth,
+        # we keep the first occurrence of every undirected segment and drop loops.
+        pairs = np.sort(np.stack([node_a, node_b], axis=1), axis=1)
+        _, first = np.unique(pairs, axis=0, return_index=True)
+        first = np.sort(first)
+        first = first[node_a[first] != node_b[first]]
+        self.node_a = node_a[first]
+        self.node_b = node_b[first]
+
+        self.node_ids = np.unique(np.concatenate([self.node_a, self.node_b]))
+        endpoints = np.concatenate([np.searchsorted(self.node_ids, self.node_a),
+                                    np.searchsorted(self.node_ids, self.node_b)])
+        segments = np.tile(np.arange(len(self.node_a)), 2)
+
+        order = np.argsort(endpoints, kind="stable")
+        self.incident = segments[order]
+        self.indptr = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+        self.indptr[1:] = np.cumsum(np.bincount(endpoints, minlength=len(self.node_ids)))
+
+    @classmethod
+    def from_csr(cls, way_ptr: np.ndarray, way_nodes: np.ndarray) -> 'SegmentIndex':
+        """
+        Builds the index from ways stored in CSR arrays (see osm_cache.OSMExtract).
+
+        :param way_ptr: nodes of the i-th way are way_nodes[way_ptr[i]:way_ptr[i + 1]];
+        :param way_nodes: node ids of all the ways, way after way.
+        :return: segment index over all consecutive node pairs of all the ways.
+        """
+        way_nodes = np.asarray(way_nodes, dtype=np.int64)
+        # pairs (last node of a way, first node of the next way) aren't segments
+        within_way = np.ones(max(len(way_nodes) - 1, 0), dtype=bool)
+        way_ends = np.asarray(way_ptr[1:-1], dtype=np.int64) - 1
+        within_way[way_ends[(way_ends >= 0) & (way_ends < len(within_way))]] = False
+        return cls(way_nodes[:-1][within_way], way_nodes[1:][within_way])
+
+    def __len__(self) -> int:
+        return len(self.node_a)
+
+    def incident_segments(self, node_ids: Iterable[int]) -> np.ndarray:
+        """
+        :param node_ids: OSM node ids, unknown ids are ignored.
+        :return: numbers of segments incident to any of the nodes, ascending.
+        """
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        positions = np.searchsorted(self.node_ids, node_ids)
+        positions = positions[positions < len(self.node_ids)]
+        positions = positions[np.isin(self.node_ids[positions], node_ids)]
+
+        starts = self.indptr[positions]
+        counts = self.indptr[positions + 1] - starts
+        return np.unique(self.incident[gather_ranges(starts, counts)])
+
+    def edges_within(self, neighbours: Iterable[int]) -> np.ndarray:
+        """
+        Collects the segments whose both nodes are in the neighbourhood.
+
+        :param neighbours: OSM ids of the neighbourhood nodes.
+        :return: (E, 2) array of node id pairs in the order the ways list them.
+        """
+        neighbours = np.asarray(neighbours, dtype=np.int64)
+        segments = self.incident_segments(neighbours)
+        node_a = self.node_a[segments]
+        node_b = self.node_b[segments]
+        inside = np.isin(node_a, neighbours) & np.isin(node_b, neighbours)
+        return np.stack([node_a[inside], node_b[inside]], axis=1)
+
+
+def find_seed_positions(spatial_index: SpatialIndex,
+                        segment_index: SegmentIndex,
+                        min_nodes: int,
+                        size: float = NEIGHBOURHOOD_SIZE,
+                        chunk_size: int = SEED_CHUNK_SIZE) -> np.ndarray:
+    """
+    Finds the nodes that can be the centre of a large enough graph.
+
+    Only nodes lying on some way can get into the adjacency list,
+    so a neighbourhood with at most min_nodes of them is rejected anyway.
+
+    :param spatial_index: grid index over all the nodes;
+    :param segment_index: way segments indexed by node id;
+    :param min_nodes: graphs must have more than min_nodes nodes;
+    :param size: half-side of the square neighbourhood in degrees;
+    :param chunk_size: number of neighbourhoods counted in one vectorized call.
+    :return: positions (in the spatial index arrays) of the viable centres, ascending.
+    """
+    on_way = np.isin(spatial_index.ids, segment_index.node_ids)
+    counts = np.concatenate(
+        [spatial_index.count_within(spatial_index.lat[start:start + chunk_size],
+                                    spatial_index.lon[start:start + chunk_size],
+                                    size, mask=on_way)
+         for start in range(0, len(spatial_index), chunk_size)] or [np.zeros(0, dtype=np.int64)])
+    return np.flatnonzero(counts > min_nodes)
+
+
+def load_seed_positions(extract_path: str,
+                        min_nodes: int,
+                        size: float = NEIGHBOURHOOD_SIZE) -> np.ndarray:
+    """
+    Loads viable centres of neighbourhoods (see find_seed_positions) of a cached OSM extract,
+    they are found and stored next to the extract on the first call with these parameters.
+
+    :param extract_path: directory of the cached extract;
+    :param min_nodes: graphs must have more than min_nodes nodes;
+    :param size: half-side of the square neighbourhood in degrees.
+    :return: memory-mapped positions of the viable centres.
+    """
+    seeds_path = os.path.join(extract_path, "seed_positions")
+    meta = {"min_nodes": min_nodes, "size": size}
+
+    if os.path.isdir(seeds_path):
+        (positions,), saved_meta = load_arrays(seeds_path, ("positions",))
+        if saved_meta == meta:
+            return positions
+
+    spatial_index, segment_index = load_indexes(extract_path)
+    save_arrays(seeds_path,
+                {"positions": find_seed_positions(spatial_index, segment_index, min_nodes, size)},
+                meta=meta)
+    (positions,), _ = load_arrays(seeds_path, ("positions",))
+    return positions
+
+
+def load_indexes(extract_path: str) -> Tuple[SpatialIndex, SegmentIndex]:
+    """
+    Loads both indexes of a cached OSM extract, they are built and stored
+    next to the extract on the first call.
+
+    :param extract_path: directory of the cached extract (see osm_cache.get_OSM_extract_path).
+    :return: memory-mapped spatial and segment indexes.
+    """
+    spatial_path = os.path.join(extract_path, "spatial_index")
+    segment_path = os.path.join(extract_path, "segment_index")
+
+    if not os.path.isdir(spatial_path) or not os.path.isdir(segment_path):
+        extract = load_extract(extract_path)
+        SpatialIndex(extract.node_ids, extract.lat, extract.lon).save(spatial_path)
+        SegmentIndex.from_csr(extract.way_ptr, extract.way_nodes).save(segment_path)
+
+    return SpatialIndex.load(spatial_path), SegmentIndex.load(segment_path)
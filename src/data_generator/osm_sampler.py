@@ -1,10 +1,11 @@
+from src.data_generator.osm_index import SpatialIndex, SegmentIndex, \
+    NEIGHBOURHOOD_SIZE
+from src.data_generator.graph import Graph
 from itertools import product
-from collections import defaultdict
-from random import randint, choice, shuffle
-from typing import Tuple, Union
-import overpass
+from random import randint, randrange, shuffle
+from typing import Tuple, Union, Optional
+import numpy as np
 import string
-import json
 
 
 def generate_names() -> list[str]:
@@ -21,32 +22,6 @@ def generate_names() -> list[str]:
     return names
 
 
-def query_from_OSM(area='Санкт-Петербург') -> Tuple[list, dict[int:list]]:
-    """
-    Queries data about paths on SPb city-map from OSM.
-
-    :return: ways and nodes connected by them.
-    """
-    api = overpass.API()
-
-    # OSM query language is very wierd, it is what it is:
-    rail_response = api.get(
-        f'area[name="{area}"];'
-        f'way(area)[highway=path];'
-        f'(._;>;);',
-        responseformat="json")
-    # We might want to read from that in the future
-    with open('response.json', 'w') as rf:
-        json.dump(rail_response, rf)
-
-    elements = rail_response['elements']
-    # way = sequence of connected nodes
-    ways = [el for el in elements if 'type' in el and el['type']=='way']
-    nodes = {el['id']: el for el in elements if 'type' in el and el['type']=='node'}
-
-    return ways, nodes
-
-
 def get_node_name(node_id: int, node_name_dict: dict[int: str], names: list[str]) \
         -> Tuple[dict[int: str], str]:
     """
@@ -74,74 +49,70 @@ def get_node_name(node_id: int, node_name_dict: dict[int: str], names: list[str]
     return node_name_dict, new_name
 
 
-def get_nodes_in_neighbourhood(nodes) -> list:
+def get_nodes_in_neighbourhood(spatial_index: SpatialIndex,
+                               neighbourhood_size: float = NEIGHBOURHOOD_SIZE,
+                               seed_positions: Optional[np.ndarray] = None) -> list:
     """
     Given all the nodes, we randomly choose one and take all
     nodes in its square neighbourhood, assuming that in our region
     lat and lon are proportional to x, y..
 
-    :param nodes: all the nodes,
+    :param spatial_index: grid index over all the nodes, built once
+                          (see osm_index.load_indexes);
+    :param neighbourhood_size: half-side of the square neighbourhood in degrees;
+    :param seed_positions: if given, the node is chosen only among these positions
+                           (see osm_index.find_seed_positions), otherwise among all the nodes.
     :return: randomly chosen node and his neighbours.
     """
-    node_num = choice([*nodes.keys()])
+    if seed_positions is not None:
+        node_pos = int(seed_positions[randrange(len(seed_positions))])
+    else:
+        node_pos = randrange(len(spatial_index))
 
-    neighbourhood_size = 0.001
+    base_lat = spatial_index.lat[node_pos]
+    base_lon = spatial_index.lon[node_pos]
 
-    base_node = nodes[node_num]
-    base_lat = base_node['lat']
-    base_lon = base_node['lon']
+    nodes_in_neighbourhood, = spatial_index.query(base_lat, base_lon, neighbourhood_size)
 
-    nodes_in_neighbourhood = [identifier for identifier, data in nodes.items() if
-                              abs(data['lat'] - base_lat) < neighbourhood_size
-                              and
-                              abs(data['lon'] - base_lon) < neighbourhood_size]
+    return nodes_in_neighbourhood.tolist()
 
-    return nodes_in_neighbourhood
 
-
-def create_adj_list(ways, neighbours) -> dict[str: dict[str: dict[str: Union[str, int]]]]:
+def create_adj_list(segment_index: SegmentIndex, neighbours,
+                    edges: Optional[np.ndarray] = None,
+                    node_name_dict: Optional[dict] = None) -> Union[Graph, str]:
     """
-    Convert OSM-data to our custom formatted adjacency list represented graph.
-
-    :param ways: ways queried from osm;
-    :param neighbours: random nodes that are nearby.
-    :return: adjacency-list represented graph,
-             ex.: {'R2': {'D2': {'weight': '1', 'type': 0}, ...}, ...}.
-             Weight isn't used and is always '1', we keep it to satisfy
-             Problem API.
+    Convert OSM-data to our graph, nodes are named in the order they first appear in the edges.
+
+    :param segment_index: way segments queried from osm, indexed by node id
+                          (built once, see osm_index.load_indexes);
+    :param neighbours: random nodes that are nearby;
+    :param edges: segments of the neighbourhood if they were already collected
+                  (and maybe filtered) with segment_index.edges_within(neighbours);
+    :param node_name_dict: if given, OSM node id -> node name is filled in there,
+                           ex.: to find coordinates of the named nodes.
+    :return: the graph (see graph.Graph.to_adj_list for the adjacency list of the README),
+             every edge gets a random type, 1 or 2.
     """
-    node_name_dict = dict()
-    adj_list = defaultdict(dict)
+    node_name_dict = dict() if node_name_dict is None else node_name_dict
 
     names = generate_names()
 
-    for way in ways:
-
-        nodes_list = way['nodes']
-
-        for node_num in range(len(nodes_list) - 1):
-
-            first_node_id = nodes_list[node_num]
-            second_node_id = nodes_list[node_num + 1]
-            if first_node_id in neighbours and second_node_id in neighbours:
+    # only the segments incident to the neighbourhood are touched
+    if edges is None:
+        edges = segment_index.edges_within(neighbours)
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
 
-                new_name_data = get_node_name(first_node_id, node_name_dict, names)
-                if not new_name_data:
-                    print(node_num)
-                    return 'More nodes than was expected'
+    # nodes are numbered by their first appearance, as get_node_name names them
+    node_nums = {}
+    edge_nodes = [node_nums.setdefault(node_id, len(node_nums)) for node_id in edges.ravel().tolist()]
 
-                node_name_dict, first_node_name = new_name_data
-
-                new_name_data = get_node_name(nodes_list[node_num + 1], node_name_dict, names)
-                if not new_name_data:
-                    print(node_name_dict)
-                    return 'More nodes than was expected'
-
-                node_name_dict, second_node_name = new_name_data
-
-                edge_type = randint(1, 2)
+    # we ran out of names
+    if len(node_nums) > len(names):
+        print(list(node_nums)[len(names)])
+        return 'More nodes than was expected'
 
-                adj_list[first_node_name] = {second_node_name: {"type": edge_type, "weight": "1"}}
-                adj_list[second_node_name] = {first_node_name: {"type": edge_type, "weight": "1"}}
+    node_name_dict.update(zip(node_nums, names))
+    edge_types = [randint(1, 2) for _ in range(len(edges))]
 
-    return adj_list
+    # a segment may repeat, its last type is kept, as it overwrote the adjacency list before
+    return Graph.from_edge_list(names[:len(node_nums)], np.array(edge_nodes).reshape(-1, 2), edge_types)
@@ -0,0 +1,154 @@
+from typing import Iterator, TextIO
+from array import array
+import numpy as np
+import json
+import re
+
+# Characters read from the response at once, memory doesn't depend on the response size.
+CHUNK_SIZE = 1 << 20
+
+_ELEMENTS_START = re.compile(r'"elements"\s*:\s*\[')
+# the only characters that matter for finding where an element ends
+_SPECIAL = re.compile(r'[{}"\\\]]')
+
+
+def _chunks_after_elements_start(fp: TextIO, chunk_size: int) -> Iterator[str]:
+    """
+    :return: text of the response after the opening bracket of the "elements" array, chunk by chunk.
+    """
+    head = ""
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            raise ValueError("No 'elements' in the Overpass response.")
+        head += chunk
+        match = _ELEMENTS_START.search(head)
+        if match:
+            break
+        # the key might be cut by the chunk border
+        head = head[-32:]
+
+    yield head[match.end():]
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _check_response_end(tail: str) -> None:
+    """
+    :param tail: text of the response after the "elements" array.
+    :raise ValueError: if the response is cut or Overpass reports an error in a remark
+                       (ex.: a runtime error or a timeout, the elements are incomplete then).
+    """
+    tail = tail.strip()
+    try:
+        rest = json.loads("{" + tail[1:]) if tail.startswith(",") else json.loads("{" + tail)
+    except ValueError as error:
+        raise ValueError("Overpass response is cut after the elements.") from error
+    if "remark" in rest:
+        raise ValueError(f"Overpass response is incomplete: {rest['remark']}")
+
+
+def iter_element_texts(fp: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """
+    Finds the objects of the "elements" array in a text stream,
+    only the text of the element being read is kept in memory.
+
+    :param fp: text stream of the Overpass json response;
+    :param chunk_size: characters read at once.
+    :return: json texts of the elements, one by one.
+    :raise ValueError: if the response is incomplete, after the elements read before.
+    """
+    pending = ""  # beginning of the element cut by the chunk border
+    depth = 0
+    in_string = False
+    skip = 0  # the escaped character may be the first one of the next chunk
+
+    chunks = _chunks_after_elements_start(fp, chunk_size)
+    for chunk in chunks:
+        text = pending + chunk
+        pos = len(pending) + skip
+        start = 0 if depth else None
+        skip = 0
+
+        while True:
+            match = _SPECIAL.search(text, pos)
+            if match is None:
+                break
+            char, pos = match.group(), match.end()
+
+            if in_string:
+                if char == "\\":
+                    if pos == len(text):
+                        skip = 1
+                    pos += 1
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                if depth == 0:
+                    start = match.start()
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    yield text[start:pos]
+                    start = None
+            elif depth == 0:
+                # "]" closes the elements array, the rest of the response is short
+                _check_response_end(text[pos:] + "".join(chunks))
+                return
+
+        pending = text[start:] if start is not None else ""
+
+    raise ValueError("Overpass response ends inside of an element." if depth else
+                     "Overpass response ends before the end of the elements.")
+
+
+def iter_elements(fp: TextIO, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+    """
+    Parses the Overpass json response incrementally.
+
+    :param fp: text stream of the response: an opened saved response or an HTTP stream;
+    :param chunk_size: characters read at once.
+    :return: 'elements' of the response, one by one.
+    """
+    for element in iter_element_texts(fp, chunk_size):
+        yield json.loads(element)
+
+
+def columns_from_stream(fp: TextIO, chunk_size: int = CHUNK_SIZE) -> dict[str: np.ndarray]:
+    """
+    Converts the Overpass json response to columns as it is read,
+    only ids, coordinates and node lists are kept, in compact typed buffers.
+
+    :param fp: text stream of the response: an opened saved response or an HTTP stream;
+    :param chunk_size: characters read at once.
+    :return: the fields of osm_cache.OSMExtract.
+    """
+    node_ids, lat, lon = array("q"), array("d"), array("d")
+    way_ids, way_lengths, way_nodes = array("q"), array("q"), array("q")
+
+    for element in iter_elements(fp, chunk_size):
+        element_type = element.get('type')
+        if element_type == 'node':
+            node_ids.append(element['id'])
+            lat.append(element['lat'])
+            lon.append(element['lon'])
+        elif element_type == 'way':
+            way_ids.append(element['id'])
+            way_lengths.append(len(element['nodes']))
+            way_nodes.extend(element['nodes'])
+
+    way_ptr = np.zeros(len(way_ids) + 1, dtype=np.int64)
+    way_ptr[1:] = np.cumsum(np.frombuffer(way_lengths, dtype=np.int64))
+
+    return {"node_ids": np.frombuffer(node_ids, dtype=np.int64),
+            "lat": np.frombuffer(lat, dtype=np.float64),
+            "lon": np.frombuffer(lon, dtype=np.float64),
+            "way_ids": np.frombuffer(way_ids, dtype=np.int64),
+            "way_ptr": way_ptr,
+            "way_nodes": np.frombuffer(way_nodes, dtype=np.int64)}
@@ -0,0 +1,173 @@
+"""
+Local stand-in for the Overpass API: serves recorded responses, so that fetching
+(see osm_fetch) can be run and checked without OSM.
+
+A recorded response is <responses_dir>/<query key>.json, the key is response_key
+of the query as osm_cache.build_query / osm_fetch.build_bbox_query make it.
+Queries without a recording get an empty response.
+
+Usage: python -m src.data_generator.overpass_stub <responses_dir> [--port 8080] [--fail-first 2] [--bad-first 4]
+"""
+from src.data_generator.osm_cache import overpass_ql
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+from typing import Optional
+import argparse
+import threading
+import hashlib
+import shutil
+import json
+import os
+
+EMPTY_RESPONSE = json.dumps({"version": 0.6, "elements": []}).encode("utf-8")
+# what Overpass answers with 200 when the query runs out of time or memory
+REMARK_RESPONSE = json.dumps({"version": 0.6, "elements": [],
+                              "remark": "runtime error: Query timed out in \"query\" at line 1 after 180 seconds."}
+                             ).encode("utf-8")
+# kinds of broken 200 answers, in the order they are given
+BAD_RESPONSES = ("remark", "empty", "truncated", "cut")
+
+
+def response_key(query: str) -> str:
+    """
+    :param query: Overpass query, without the output settings added by osm_cache.overpass_ql.
+    :return: file name (without .json) of the recorded response of the query.
+    """
+    return hashlib.sha1(overpass_ql(query).encode("utf-8")).hexdigest()[:16]
+
+
+def record_response(responses_dir: str, query: str, response_path: str) -> None:
+    """
+    Adds a saved Overpass response to the recordings.
+
+    :param responses_dir: directory of the recorded responses;
+    :param query: Overpass query the response answers;
+    :param response_path: json of the response, ex.: a response saved from the real Overpass API.
+    """
+    os.makedirs(responses_dir, exist_ok=True)
+    shutil.copyfile(response_path, os.path.join(responses_dir, response_key(query) + ".json"))
+
+
+class OverpassStub:
+    """
+    Overpass interpreter endpoint on localhost, run in a background thread:
+
+        with OverpassStub("recorded") as stub:
+            get_merged_extract_path(bbox=..., url=stub.url)
+
+    The first fail_first requests are answered with 429 Too Many Requests,
+    as a busy Overpass instance does, to exercise retries.
+    The next bad_first requests are answered with 200 and a broken response,
+    one of BAD_RESPONSES after another:
+    "remark" - the elements end with a runtime error remark, as on a timeout;
+    "empty" - no body at all;
+    "truncated" - the first half of the response, as if it was complete;
+    "cut" - the first half of the response, the connection is closed before the rest.
+    """
+
+    def __init__(self, responses_dir: str, port: int = 0, fail_first: int = 0, bad_first: int = 0):
+        """
+        :param responses_dir: directory of the recorded responses;
+        :param port: port to listen to, any free one if 0;
+        :param fail_first: number of the first requests to answer with 429;
+        :param bad_first: number of the requests after them to answer with a broken response.
+        """
+        self.responses_dir = responses_dir
+        self.fail_first = fail_first
+        self.bad_first = bad_first
+        self.requests = []  # keys of all the received queries, in order
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/interpreter"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse can be checked
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode("utf-8"))
+                query = form.get("data", [""])[0]
+                key = hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+
+                with stub._lock:
+                    stub.requests.append(key)
+                    number = len(stub.requests)
+                if number <= stub.fail_first:
+                    self._send(429, b"rate limited")
+                    return
+
+                path = os.path.join(stub.responses_dir, key + ".json")
+                if os.path.isfile(path):
+                    with open(path, "rb") as fp:
+                        body = fp.read()
+                else:
+                    body = EMPTY_RESPONSE
+
+                bad = number - stub.fail_first - 1
+                kind = BAD_RESPONSES[bad % len(BAD_RESPONSES)] if bad < stub.bad_first else None
+                if kind is None:
+                    self._send(200, body)
+                elif kind == "remark":
+                    self._send(200, REMARK_RESPONSE)
+                elif kind == "empty":
+                    self._send(200, b"")
+                elif kind == "truncated":
+                    self._send(200, body[:len(body) // 2])
+                else:
+                    self._send(200, body[:len(body) // 2], length=len(body))
+                    self.close_connection = True
+
+            def _send(self, status: int, body: bytes, length: Optional[int] = None):
+                """
+                :param length: Content-Length to announce, len(body) if not given.
+                """
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body) if length is None else length))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'OverpassStub':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> 'OverpassStub':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("responses_dir", help="directory of the recorded responses")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fail-first", type=int, default=0, help="requests to answer with 429")
+    parser.add_argument("--bad-first", type=int, default=0,
+                        help="requests after them to answer with a broken response")
+    args = parser.parse_args()
+
+    stub = OverpassStub(args.responses_dir, args.port, args.fail_first, args.bad_first)
+    print(f"Serving {args.responses_dir} at {stub.url}")
+    stub.serve_forever()
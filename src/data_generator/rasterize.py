@@ -0,0 +1,134 @@
+from src.data_generator.metrics import Metrics, NullMetrics, NULL_METRICS
+from src.data_generator.graph import Graph
+from src.data_generator.util import CategoryId
+from typing import Union, Tuple
+import numpy as np
+import math
+import cv2
+
+# Native renderer: nodes are drawn at their projected OSM coordinates,
+# sizes mimic what graphviz draws for draw_graph.
+NODE_RADIUS = 24  # px, graphviz circle of a two-symbol label is 0.5 inch wide
+MIN_NODE_DISTANCE = 3 * NODE_RADIUS  # px between the centres of the closest nodes
+MIN_IMG_SIZE = 60
+MAX_IMG_SIZE = 800
+BORDER = 6  # px, the graph must be at least 5 px away from the image border
+LINE_THICKNESS = 1
+DOUBLE_EDGE_GAP = 4  # px between the two lines of a two-line edge
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.6
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+# cv2 drawing functions take fixed-point coordinates with this many fractional bits
+SHIFT = 4
+
+
+def project(coords: dict[str: Tuple[float, float]]) \
+        -> Tuple[list[str], np.ndarray, Tuple[int, int]]:
+    """
+    Projects node lat/lon to pixels, so that the closest nodes are MIN_NODE_DISTANCE apart
+    unless the image would get bigger than MAX_IMG_SIZE. North is up.
+
+    :param coords: node name -> (lat, lon).
+    :return: node names + (N, 2) array of x, y of the node centres, aligned with the names
+             + width and height of the image in pixels.
+    """
+    names = list(coords.keys())
+    lat, lon = np.array([coords[name] for name in names], dtype=np.float64).reshape(-1, 2).T
+
+    # equirectangular projection is exact enough for a neighbourhood
+    xy = np.stack([(lon - lon.min()) * math.cos(math.radians(lat.mean())),
+                   lat.max() - lat], axis=1)
+
+    distances = np.linalg.norm(xy[:, None, :] - xy[None, :, :], axis=-1)
+    distances = distances[distances > 0]
+    scale = MIN_NODE_DISTANCE / distances.min() if len(distances) else 1.0
+
+    margin = NODE_RADIUS + BORDER
+    max_extent = MAX_IMG_SIZE - 2 * margin
+    extent = float(xy.max() * scale) if len(xy) else 0.0
+    if extent > max_extent:
+        scale *= max_extent / extent
+    xy = xy * scale + margin
+
+    width, height = np.maximum(np.ceil(xy.max(axis=0) + margin), MIN_IMG_SIZE).astype(int).tolist()
+    return names, xy, (width, height)
+
+
+def _fixed(point: np.ndarray) -> Tuple[int, int]:
+    x, y = np.round(point * (1 << SHIFT)).astype(int).tolist()
+    return x, y
+
+
+def _diagonal(points: np.ndarray, start: np.ndarray, end: np.ndarray,
+              img_size: Tuple[int, int]) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """
+    Tight bbox of the drawn points, its corners are oriented as the edge goes:
+    "upper_left" is the corner on the start side, as in obtain_edge_bboxes.
+    """
+    width, height = img_size
+    low = np.clip(np.floor(points.min(axis=0)) - LINE_THICKNESS, 0, [width - 1, height - 1])
+    high = np.clip(np.ceil(points.max(axis=0)) + LINE_THICKNESS, 0, [width - 1, height - 1])
+    corner_1 = np.where(start <= end, low, high).astype(int).tolist()
+    corner_2 = np.where(start <= end, high, low).astype(int).tolist()
+    return tuple(corner_1), tuple(corner_2)
+
+
+def rasterize_graph(graph: Graph,
+                    coords: dict[str: Tuple[float, float]],
+                    metrics: Union[Metrics, NullMetrics] = NULL_METRICS) \
+        -> Tuple[bytes, list[dict[str: Tuple[int, int]]], list[dict[str: Union[Tuple[int, int]], int]]]:
+    """
+    Draws the graph at its OSM node coordinates, in memory, without graphviz.
+    Bboxes are the extents of what is actually drawn, nothing is estimated.
+
+    :param graph: the graph, every its edge is drawn once;
+    :param coords: node name -> (lat, lon) of the OSM node;
+    :param metrics: rendering is timed there, if enabled.
+    :return: png file contents + node bboxes (see obtain_node_bboxes)
+             + edge bboxes (see obtain_edge_bboxes).
+    """
+    with metrics.stage("render"):
+        names, xy, img_size = project(coords)
+        edges, types = graph.edge_index(names), graph.types
+
+        width, height = img_size
+        img = np.full((height, width, 3), WHITE, dtype=np.uint8)
+
+        edge_bboxes = []
+        for (node_1, node_2), edge_type in zip(edges.tolist(), types.tolist()):
+            center_1, center_2 = xy[node_1], xy[node_2]
+            length = np.linalg.norm(center_2 - center_1)
+            direction = (center_2 - center_1) / length if length else np.zeros(2)
+            # lines go from circle to circle
+            start = center_1 + direction * NODE_RADIUS
+            end = center_2 - direction * NODE_RADIUS
+
+            if edge_type==CategoryId.EDGE_TYPE_2:
+                normal = np.array([-direction[1], direction[0]]) * DOUBLE_EDGE_GAP / 2
+                lines = [(start + normal, end + normal), (start - normal, end - normal)]
+            else:
+                lines = [(start, end)]
+            for line_start, line_end in lines:
+                cv2.line(img, _fixed(line_start), _fixed(line_end), BLACK,
+                         LINE_THICKNESS, cv2.LINE_AA, SHIFT)
+
+            upper_left, lower_right = _diagonal(np.array([point for line in lines for point in line]),
+                                                start, end, img_size)
+            edge_bboxes.append({"type": edge_type, "upper_left": upper_left, "lower_right": lower_right})
+
+        node_bboxes = []
+        for name, center in zip(names, xy):
+            cv2.circle(img, _fixed(center), NODE_RADIUS << SHIFT, BLACK, LINE_THICKNESS, cv2.LINE_AA, SHIFT)
+
+            (text_width, text_height), _ = cv2.getTextSize(name, FONT, FONT_SCALE, LINE_THICKNESS)
+            origin = np.round(center + [-text_width / 2, text_height / 2]).astype(int).tolist()
+            cv2.putText(img, name, tuple(origin), FONT, FONT_SCALE, BLACK, LINE_THICKNESS, cv2.LINE_AA)
+
+            upper_left, lower_right = _diagonal(np.array([center - NODE_RADIUS, center + NODE_RADIUS]),
+                                                np.zeros(2), np.ones(2), img_size)
+            node_bboxes.append({"upper_left": upper_left, "lower_right": lower_right})
+
+        _, png = cv2.imencode(".png", img)
+
+    return png.tobytes(), node_bboxes, edge_bboxes
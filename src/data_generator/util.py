@@ -1,7 +1,10 @@
-from enum import IntEnum
+from typing import Tuple
+from enum import IntEnum, Enum
+import numpy as np
+import struct
 
 
-class Ratio(IntEnum):
+class Ratio(float, Enum):
     """
     Unit ratios.
 
@@ -10,7 +13,10 @@ class Ratio(IntEnum):
     """
     INCH_TO_PIXEL = 96  # 1 inch = 96 pixels
     INCH_TO_GVIZ_POINT = 72  # 1 point = 1/72 inch
+    # float, not int: an IntEnum silently truncated 4/3 to 1
     POINT_TO_PIXEL = INCH_TO_PIXEL / INCH_TO_GVIZ_POINT
+    # margin graphviz adds around the drawing, https://graphviz.org/docs/attrs/pad/
+    GVIZ_PAD_IN_POINTS = 4
 
 
 class CategoryId(IntEnum):
@@ -31,3 +37,72 @@ class Shift(IntEnum):
     LOWER_EXPANSION = 9
     SHIFT_FROM_BORDER = 1
     PUSH_APART = 20
+
+
+def png_size(png: bytes) -> Tuple[int, int]:
+    """
+    Reads image size from the png header, no pixel decoding is done.
+
+    :param png: png file contents (at least the first 24 bytes).
+    :return: width and height in pixels.
+    """
+    # 8 bytes of signature, then IHDR chunk: length, "IHDR", width, height
+    width, height = struct.unpack(">II", png[16:24])
+    return width, height
+
+
+def gather_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Concatenates index ranges [start, start + count) without a Python loop.
+
+    :param starts: first index of every range;
+    :param counts: length of every range.
+    :return: all the indices of all the ranges, range after range.
+    """
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def grid_sort(rows: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Builds a uniform grid over points: they are sorted by the key of the cell they fall into,
+    so the points of any cell are found by a binary search over the sorted keys (see grid_candidates).
+
+    :param rows: cell row of every point, from 0;
+    :param cols: cell column of every point, from 0.
+    :return: order of the points by cell key + sorted cell keys + number of columns of the grid.
+    """
+    n_cols = int(cols.max()) + 1 if len(cols) else 1
+    keys = rows * n_cols + cols
+    order = np.argsort(keys, kind="stable")
+    return order, keys[order], n_cols
+
+
+def grid_candidates(order: np.ndarray, keys: np.ndarray, n_cols: int,
+                    rows: np.ndarray, cols: np.ndarray, reach: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gathers the points lying in the cells around every query cell, all queries at once.
+
+    :param order: order of the points by cell key, as grid_sort returns it;
+    :param keys: sorted cell keys, as grid_sort returns them;
+    :param n_cols: number of columns of the grid;
+    :param rows: cell row of every query;
+    :param cols: cell column of every query;
+    :param reach: cells looked at in every direction, ex.: 1 for the 3x3 cells around a query.
+    :return: (query number, point number) pairs, grouped by query number.
+    """
+    shifts = np.arange(-reach, reach + 1)
+    d_rows, d_cols = [a.ravel() for a in np.meshgrid(shifts, shifts, indexing="ij")]
+
+    rows = rows[:, None] + d_rows[None, :]
+    cols = cols[:, None] + d_cols[None, :]
+    # cells outside of the grid would alias cells of the neighbouring row
+    valid = (rows >= 0) & (cols >= 0) & (cols < n_cols)
+    cell_keys = rows * n_cols + cols
+
+    starts = np.searchsorted(keys, cell_keys, side="left")
+    ends = np.searchsorted(keys, cell_keys, side="right")
+    counts = np.where(valid, ends - starts, 0).ravel()
+
+    query_ids = np.repeat(np.repeat(np.arange(len(rows)), len(d_rows)), counts)
+    return query_ids, order[gather_ranges(starts.ravel(), counts)]
@@ -1,8 +1,10 @@
 from src.data_generator.util import Shift, CategoryId, Ratio
-from collections import defaultdict
+from src.data_generator.metrics import Metrics, NullMetrics, NULL_METRICS
+from src.data_generator.graph import Graph
 from cv2 import imread, rectangle
-from typing import Union, Tuple
+from typing import Union, Tuple, Optional
 import matplotlib.pyplot as plt
+import numpy as np
 import pygraphviz as pgv
 import pathlib
 
@@ -36,7 +38,7 @@ def get_pos_info(graph: AGraph) -> dict[str: dict[str: float]]:
     """
     Gets node positioning info needed for bbox-building.
 
-    :param graph: pgv.Agraph-represented graph structure;
+    :param graph: pgv.Agraph-represented graph structure, already laid out;
     :return: extracted node positioning info in pixels
              in this form {
              <node_name>: {"pos_x": <x coordinate of node center in pixels>,
@@ -47,80 +49,200 @@ def get_pos_info(graph: AGraph) -> dict[str: dict[str: float]]:
              NB: Here pixels are considered to be continuous, after a couple
                  operations they will become integer.
     """
-    graph.layout(prog="sfdp")
+    # positions are counted from the lower left corner of the drawing,
+    # the png also has a pad around it
+    pad = Ratio.GVIZ_PAD_IN_POINTS
 
     pos_info = {}
     for n in graph.nodes():
         x_in_points, y_in_points = n.attr['pos'].split(sep=",")
-        pos_info[n] = {"pos_x": float(x_in_points) * Ratio.POINT_TO_PIXEL,
-                       "pos_y": float(y_in_points) * Ratio.POINT_TO_PIXEL,
+        pos_info[n] = {"pos_x": (float(x_in_points) + pad) * Ratio.POINT_TO_PIXEL,
+                       "pos_y": (float(y_in_points) + pad) * Ratio.POINT_TO_PIXEL,
                        "height": float(n.attr['height']) * Ratio.INCH_TO_PIXEL,
                        "width": float(n.attr['width']) * Ratio.INCH_TO_PIXEL
                        }
     return pos_info
 
 
-def draw_graph(filename: Union[str, pathlib.Path],
-               graph_adj_list: dict[str: dict[str: dict[str: Union[str, int]]]]) \
-        -> dict[str: dict[str: float]]:
+def set_pos_info(graph: AGraph, pos_info: dict[str: dict[str: float]]) -> None:
+    """
+    Positions the nodes as get_pos_info describes them, the inverse of get_pos_info.
+
+    :param graph: pgv.Agraph-represented graph structure;
+    :param pos_info: node positioning info in pixels (see get_pos_info).
     """
-    Draws graph using its adjacency list representation,
-    returns node positioning info needed for bbox-building.
-
-    :param filename: desired name prefix of the png file;
-    :param graph_adj_list: adjacency-list represented graph,
-                           ex.: {'R2': {'D2': {'weight': '1', 'type': 0}, ...}, ...}.
-                           Weight isn't used and is always '1', we keep it to satisfy
-                           Problem API.
+    pad = Ratio.GVIZ_PAD_IN_POINTS
+
+    for n in graph.nodes():
+        info = pos_info[n]
+        x_in_points = info["pos_x"] / Ratio.POINT_TO_PIXEL - pad
+        y_in_points = info["pos_y"] / Ratio.POINT_TO_PIXEL - pad
+        n.attr['pos'] = f"{x_in_points},{y_in_points}"
+        n.attr['height'] = info["height"] / Ratio.INCH_TO_PIXEL
+        n.attr['width'] = info["width"] / Ratio.INCH_TO_PIXEL
+
+
+def draw_graph(filename: Optional[Union[str, pathlib.Path]],
+               graph: Graph,
+               metrics: Union[Metrics, NullMetrics] = NULL_METRICS,
+               pos_info: Optional[dict] = None) \
+        -> Tuple[dict[str: dict[str: float]], bytes]:
+    """
+    Draws the graph, every undirected edge once,
+    returns node positioning info needed for bbox-building
+    and the png itself, so that nobody has to read it back.
+
+    :param filename: desired name prefix of the png file,
+                     None - the png is only kept in memory;
+    :param graph: the graph, nodes are drawn with their labels;
+    :param metrics: layout and render are timed there, if enabled;
+    :param pos_info: node positioning info of an earlier layout of the same structure
+                     (see get_pos_info), if given, the layout isn't run again.
     :return: png of the graph + info about its node positioning on the image
              in this form {
              <node_name>: {"pos_x": <x coordinate of node center in pixels>,
                            "pos_y": <x coordinate of node center in pixels>,
                            "height": <height of node's boundbox in pixels>,
                            "width": <width of node's boundbox in pixels>}
-                           }
+                           } + png file contents (see util.png_size to get its size).
             NB: Here pixels are considered to be continuous, after a couple
                 operations they will become integer.
     """
-
-    # we need to mark visited nodes so as not to draw two edges
-    # while traversing the adjacency list:
-    visited = dict()
-    for node_one, _ in graph_adj_list.items():
-        visited[node_one] = defaultdict(int)
-
-    def edge_not_drawn(n_1: str, n_2: str):
-        return visited[n_1][n_2]!=1 and visited[n_2][n_1]!=1
-
-    def set_edge_drawn(n_1: str, n_2: str):
-        visited[n_1][n_2] = 1
-        visited[n_2][n_1] = 1
-
     dot = AGraph()
+    dot.graph_attr["pad"] = Ratio.GVIZ_PAD_IN_POINTS / Ratio.INCH_TO_GVIZ_POINT
     dot.node_attr["shape"] = "circle"
     dot.node_attr["fontname"] = "Tahoma"
     dot.node_attr["fontcolor"] = "black"
     dot.node_attr["color"] = "black"
 
-    # remember the structure: {'R2': {'D2': {'weight': '1', 'type': 0}, ...}, ...}
-    for node_1, node_adj_list in graph_adj_list.items():
-        for node_2, info in node_adj_list.items():
-            if edge_not_drawn(node_1, node_2):
-                if info["type"]==CategoryId.EDGE_TYPE_2:
-                    dot.add_edge(node_1, node_2, color="black:invis:black", min_len=10)
-                if info["type"]==CategoryId.EDGE_TYPE_1:
-                    dot.add_edge(node_1, node_2, min_len=10)
-                set_edge_drawn(node_1, node_2)
+    # every undirected edge is stored once, nothing is drawn twice
+    labels = graph.labels.tolist()
+    for (node_1, node_2), edge_type in zip(graph.edges.tolist(), graph.types.tolist()):
+        if edge_type==CategoryId.EDGE_TYPE_2:
+            dot.add_edge(labels[node_1], labels[node_2], color="black:invis:black", min_len=10)
+        if edge_type==CategoryId.EDGE_TYPE_1:
+            dot.add_edge(labels[node_1], labels[node_2], min_len=10)
+
+    # sfdp - layout engine, it runs once: the png is rendered from
+    # the very same positions the bboxes are built from
+    if pos_info is None:
+        with metrics.stage("layout"):
+            dot.layout(prog="sfdp")
+            pos_info = get_pos_info(dot)
+        with metrics.stage("render"):
+            png = dot.draw(format="png")
+    else:
+        set_pos_info(dot, pos_info)
+        with metrics.stage("render"):
+            # nop2 renders the positions as they are, as after the layout above:
+            # neato -n2 would remove node overlaps again and move the nodes off their bboxes
+            png = dot.draw(format="png", prog="nop2")
+    if filename is not None:
+        with open(filename + ".png", "wb") as fp:
+            fp.write(png)
+
+    return pos_info, png
+
+
+def pos_info_to_array(pos_info: dict[str: dict[str: float]]) -> Tuple[list[str], np.ndarray]:
+    """
+    Packs node positioning info into an array for batched bbox computation.
 
-    # sfdp - layout engine
-    dot.draw(filename + ".png", prog="sfdp")
-    pos_info = get_pos_info(dot)
+    :param pos_info: info about node positioning on the image (see get_pos_info).
+    :return: node names + (N, 4) array, its rows are aligned with the names
+             and hold pos_x, pos_y, height, width of the node in pixels.
+    """
+    names = list(pos_info.keys())
+    pos = np.array([[info["pos_x"], info["pos_y"], info["height"], info["width"]]
+                    for info in pos_info.values()], dtype=np.float64).reshape(-1, 4)
+    return names, pos
 
-    return pos_info
+
+def node_bbox_array(pos: np.ndarray, img_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Transforms node center positions and bbox sizes to bbox coordinates in pixels, all at once.
+
+    :param pos: (N, 4) array of pos_x, pos_y, height, width (see pos_info_to_array);
+    :param img_size: width and height of the png in pixels.
+    :return: (N, 4) int array of x1, y1, x2, y2 - the "upper_left" and "lower_right"
+             corners of obtain_node_bboxes.
+    """
+    img_max_x, img_max_y = img_size
+    pos_x, pos_y, height, width = pos.T
+
+    x1 = np.trunc(pos_x - 0.5 * width)
+    x2 = np.trunc(pos_x + 0.5 * width)
+    y1 = img_max_y - np.trunc(pos_y - 0.5 * height)
+    y2 = img_max_y - np.trunc(pos_y + 0.5 * height)
+
+    # We correct bbox borders by expanding them.
+    # We don't expand further than 1 pixel from img border,
+    # coordinates must be inside the image.
+    x_max = img_max_x - Shift.SHIFT_FROM_BORDER
+    y_max = img_max_y - Shift.SHIFT_FROM_BORDER
+    x1 = np.clip(x1 - Shift.UPPER_EXPANSION, Shift.SHIFT_FROM_BORDER, x_max)
+    x2 = np.clip(x2 + Shift.LOWER_EXPANSION, Shift.SHIFT_FROM_BORDER, x_max)
+    y1 = np.clip(y1 + Shift.UPPER_EXPANSION, Shift.SHIFT_FROM_BORDER, y_max)
+    y2 = np.clip(y2 - Shift.LOWER_EXPANSION, Shift.SHIFT_FROM_BORDER, y_max)
+
+    return np.stack([x1, y1, x2, y2], axis=1).astype(np.int64)
+
+
+def edge_bbox_array(pos: np.ndarray, edges: np.ndarray, img_size: Tuple[int, int]) -> np.ndarray:
+    """
+    Obtains bboxes of all the edges at once, the node centers of an edge are
+    the diagonal of its bbox (see obtain_edge_bboxes).
+
+    :param pos: (N, 4) array of pos_x, pos_y, height, width (see pos_info_to_array);
+    :param edges: (E, 2) array of node numbers (see graph.Graph.edge_index);
+    :param img_size: width and height of the png in pixels.
+    :return: (E, 4) int array of x1, y1, x2, y2 - the "upper_left" and "lower_right"
+             corners of obtain_edge_bboxes.
+    """
+    _, img_max_y = img_size
+    too_close = 10
+
+    pos_x1, pos_y1 = pos[edges[:, 0], 0], pos[edges[:, 0], 1]
+    pos_x2, pos_y2 = pos[edges[:, 1], 0], pos[edges[:, 1], 1]
+
+    # Node centers of vertical and horizontal edges are pushed apart,
+    # the direction keeps node_1 at the "upper_left" corner.
+    close_x = np.abs(pos_x1 - pos_x2) <= too_close
+    shift_x = np.where(pos_y1 < pos_y2, -Shift.PUSH_APART, Shift.PUSH_APART) * close_x
+    pos_x1 = pos_x1 + shift_x
+    pos_x2 = pos_x2 - shift_x
+
+    close_y = np.abs(pos_y1 - pos_y2) <= too_close
+    shift_y = np.where(pos_x1 < pos_x2, -Shift.PUSH_APART, Shift.PUSH_APART) * close_y
+    pos_y1 = pos_y1 + shift_y
+    pos_y2 = pos_y2 - shift_y
+
+    x1 = np.trunc(pos_x1)
+    x2 = np.trunc(pos_x2)
+    y1 = img_max_y - np.trunc(pos_y1)
+    y2 = img_max_y - np.trunc(pos_y2)
+
+    return np.stack([x1, y1, x2, y2], axis=1).astype(np.int64)
+
+
+def show_bboxes(filename: Union[str, pathlib.Path], bboxes: np.ndarray, color: Tuple[int, int, int]) -> None:
+    """
+    Draws bboxes over the png, this is the only place the png is decoded.
+
+    :param filename: name prefix of the png file;
+    :param bboxes: (K, 4) array of x1, y1, x2, y2;
+    :param color: color of the bbox borders.
+    """
+    img = imread(filename + ".png")
+    for x1, y1, x2, y2 in bboxes.tolist():
+        rectangle(img, (x1, y1), (x2, y2), color)
+    plt.axis('off')
+    plt.imshow(img)
 
 
 def obtain_node_bboxes(filename: Union[str, pathlib.Path],
                        pos_info: dict[str: dict[str: float]],
+                       img_size: Tuple[int, int],
                        visualize: bool = False) \
         -> list[dict[str: Tuple[int, int]]]:
     """
@@ -134,55 +256,25 @@ def obtain_node_bboxes(filename: Union[str, pathlib.Path],
                                    "height": <height of node's boundbox in pixels>,
                                    "width": <width of node's boundbox in pixels>}
                                    };
-    :param visualize: whether or not to show bboxes on the image.
+    :param img_size: width and height of the png in pixels;
+    :param visualize: whether or not to show bboxes on the image,
+                      only then the png is read and decoded.
     :return: node boundboxes as list of dictionaries
              in this form [{"upper_left": (x1, y1), "lower_right": (x2, y2)}].
     """
-    img = imread(filename + ".png")
-    img_max_y = len(img)
-    img_max_x = len(img[0])
-
-    bboxes = []
-    for node, info in pos_info.items():
-        pos_x = info["pos_x"]
-        pos_y = info["pos_y"]
-        height = info["height"]
-        width = info["width"]
-
-        x1 = int(pos_x - 0.5 * width)
-        x2 = int(pos_x + 0.5 * width)
-        y1 = img_max_y - int(pos_y - 0.5 * height)
-        y2 = img_max_y - int(pos_y + 0.5 * height)
-
-        # We correct bbox borders by expanding them.
-        # We don't expand further than 1 pixel from img border,
-        # coordinates must be inside the image.
-        x1 = min(max(Shift.SHIFT_FROM_BORDER,
-            int(x1) - Shift.UPPER_EXPANSION),
-            img_max_x - Shift.SHIFT_FROM_BORDER)
-        x2 = min(max(Shift.SHIFT_FROM_BORDER,
-            int(x2) + Shift.LOWER_EXPANSION),
-            img_max_x - Shift.SHIFT_FROM_BORDER)
-        y1 = min(max(Shift.SHIFT_FROM_BORDER,
-            int(y1) + Shift.UPPER_EXPANSION),
-            img_max_y - Shift.SHIFT_FROM_BORDER)
-        y2 = min(max(Shift.SHIFT_FROM_BORDER,
-            int(y2) - Shift.LOWER_EXPANSION),
-            img_max_y - Shift.SHIFT_FROM_BORDER)
-
-        bboxes.append({"upper_left": (x1, y1),
-                       "lower_right": (x2, y2)})
-        if visualize:
-            rectangle(img, (x1, y1), (x2, y2), (0, 255, 0))
+    _, pos = pos_info_to_array(pos_info)
+    bboxes = node_bbox_array(pos, img_size)
+
     if visualize:
-        plt.axis('off')
-        plt.imshow(img)
-    return bboxes
+        show_bboxes(filename, bboxes, (0, 255, 0))
+    return [{"upper_left": (x1, y1), "lower_right": (x2, y2)}
+            for x1, y1, x2, y2 in bboxes.tolist()]
 
 
 def obtain_edge_bboxes(filename: Union[str, pathlib.Path],
-                       graph_adj_list: dict[str: dict[str: dict[str: Union[str, int]]]],
+                       graph: Graph,
                        pos_info: dict[str: dict[str: float]],
+                       img_size: Tuple[int, int],
                        visualize: bool = False) \
         -> list[dict[str: Union[Tuple[int, int]], int]]:
     """
@@ -191,12 +283,10 @@ def obtain_edge_bboxes(filename: Union[str, pathlib.Path],
     line is treated as a diagonal of the bbox.
     For vertical and horizontal edges node centers are shifted
     (pushed apart) for the diagonal approach to be applicable.
+    Every undirected edge gets exactly one bbox.
 
     :param filename: name prefix of the png file;
-    :param graph_adj_list: adjacency-list represented graph,
-                           ex.: {'R2': {'D2': {'weight': '1', 'type': 0}, ...}, ...}.
-                           Weight isn't used and is always '1', we keep it to satisfy
-                           Problem API;
+    :param graph: the graph, every its edge gets a bbox;
     :param pos_info: info about node positioning on the image
                      in this form {
                      <node_name>: {"pos_x": <x coordinate of node center in pixels>,
@@ -204,57 +294,17 @@ def obtain_edge_bboxes(filename: Union[str, pathlib.Path],
                                    "height": <height of node's boundbox in pixels>,
                                    "width": <width of node's boundbox in pixels>}
                                    };
-    :param visualize: whether or not to show bboxes on the image.
+    :param img_size: width and height of the png in pixels;
+    :param visualize: whether or not to show bboxes on the image,
+                      only then the png is read and decoded.
     :return: edge boundboxes as list of dictionaries
              in this form [{"type": <edge_type>,
                             "upper_left": (x1, y1), "lower_right": (x2, y2)}].
     """
-    img = imread(filename + ".png")
-    img_max_y = len(img)
-
-    def too_close(pos1, pos2):
-        return abs(pos1 - pos2) <= 10
-
-    bboxes = []
-    for node_1, node_adj_list in graph_adj_list.items():
-        for node_2, info in node_adj_list.items():
-            # node_1-------node_2 = edge
-            pos_x1 = pos_info[node_1]["pos_x"]
-            pos_x2 = pos_info[node_2]["pos_x"]
-
-            pos_y1 = pos_info[node_1]["pos_y"]
-            pos_y2 = pos_info[node_2]["pos_y"]
-
-            if too_close(pos_x1, pos_x2):
-                # this needs to be checked as rectangle
-                # is defined by its upper left and lower right vertices.
-                if pos_y1 < pos_y2:
-                    pos_x1 -= Shift.PUSH_APART
-                    pos_x2 += Shift.PUSH_APART
-                else:
-                    pos_x2 -= Shift.PUSH_APART
-                    pos_x1 += Shift.PUSH_APART
-
-            if too_close(pos_y1, pos_y2):
-                if pos_x1 < pos_x2:
-                    pos_y1 -= Shift.PUSH_APART
-                    pos_y2 += Shift.PUSH_APART
-                else:
-                    pos_y2 -= Shift.PUSH_APART
-                    pos_y1 += Shift.PUSH_APART
-
-            x1 = int(pos_x1)
-            x2 = int(pos_x2)
-            y1 = img_max_y - int(pos_y1)
-            y2 = img_max_y - int(pos_y2)
-
-            edge_type = info["type"]
-            bboxes.append({"type": edge_type,
-                           "upper_left": (x1, y1),
-                           "lower_right": (x2, y2)})
-            if visualize:
-                rectangle(img, (x1, y1), (x2, y2), (255, 0, 0))
+    names, pos = pos_info_to_array(pos_info)
+    bboxes = edge_bbox_array(pos, graph.edge_index(names), img_size)
+
     if visualize:
-        plt.axis('off')
-        plt.imshow(img)
-    return bboxes
+        show_bboxes(filename, bboxes, (255, 0, 0))
+    return [{"type": edge_type, "upper_left": (x1, y1), "lower_right": (x2, y2)}
+            for edge_type, (x1, y1, x2, y2) in zip(graph.types.tolist(), bboxes.tolist())]
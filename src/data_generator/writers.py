@@ -0,0 +1,173 @@
+from src.data_generator.annotations import COCO_annotate_image, \
+    COCO_annotations, \
+    data_to_pickle, \
+    ANNOTATION_FORMAT_VERSION
+from src.data_generator.graph import Graph
+from src.data_generator.util import CategoryId
+from typing import NamedTuple, Union, Tuple
+import numpy as np
+import tarfile
+import time
+import json
+import io
+import os
+
+SAMPLES_PER_SHARD = 1000
+# size of the write buffer of a shard, pngs are appended through it
+SHARD_BUFFER_SIZE = 4 * 1024 * 1024
+# files FileWriter writes for a sample, by suffix after the sample name
+SAMPLE_FILE_SUFFIXES = (".png", "_src_dict.pickle", ".json")
+
+
+class Sample(NamedTuple):
+    """
+    Everything generated for one graph, enough for any writer.
+    """
+    name: str  # ex.: "graph_20221122_022933_1186"
+    png: bytes
+    graph: Graph
+    node_bboxes: list[dict[str: Tuple[int, int]]]
+    edge_bboxes: list[dict[str: Union[Tuple[int, int]], int]]
+    img_size: Tuple[int, int]
+
+
+class FileWriter:
+    """
+    Per-file layout: <name>.png, <name>_src_dict.pickle and <name>.json for every sample.
+    """
+
+    def __init__(self, output_dir: str):
+        """
+        :param output_dir: directory to write the files to.
+        """
+        self.output_dir = output_dir
+
+    def add(self, sample: Sample) -> None:
+        filepath = os.path.join(self.output_dir, sample.name)
+        with open(filepath + ".png", "wb") as fp:
+            fp.write(sample.png)
+        data_to_pickle(filepath, sample.graph)
+        COCO_annotate_image(filepath, sample.node_bboxes, sample.edge_bboxes, sample.img_size)
+
+    def paths(self, name: str) -> list[str]:
+        """
+        :param name: name of a sample.
+        :return: files add writes for the sample.
+        """
+        return [os.path.join(self.output_dir, name + suffix) for suffix in SAMPLE_FILE_SUFFIXES]
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'FileWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ShardWriter:
+    """
+    Sharded layout: samples are streamed into shards of samples_per_shard samples each.
+
+    A shard <prefix>shard_<num> consists of
+      - .tar with the pngs, appended one by one through a write buffer;
+      - .json with one COCO dataset (images, annotations, categories tables);
+      - _adj.npz with the adjacency lists of all the images in columns:
+        edges of the i-th image are src/dst/type[image_ptr[i]:image_ptr[i + 1]],
+        every undirected edge is stored once, weight is always '1' and isn't stored.
+    <prefix>index.json lists the shards and the samples in them.
+    """
+
+    def __init__(self, prefix: str, samples_per_shard: int = SAMPLES_PER_SHARD):
+        """
+        :param prefix: path prefix of all the shard files, ex.: "data/graph_20221122_022933_";
+        :param samples_per_shard: number of samples in a full shard.
+        """
+        self.prefix = prefix
+        self.samples_per_shard = samples_per_shard
+        self.shards = []
+        self._open_shard()
+
+    def _open_shard(self) -> None:
+        self.shard_name = f"{os.path.basename(self.prefix)}shard_{len(self.shards):05d}"
+        self._file = open(self.prefix + f"shard_{len(self.shards):05d}.tar", "wb",
+                          buffering=SHARD_BUFFER_SIZE)
+        self._tar = tarfile.open(fileobj=self._file, mode="w")
+        self._images = []
+        self._annotations = []
+        self._edges = []
+        self._image_ptr = [0]
+
+    def add(self, sample: Sample) -> None:
+        info = tarfile.TarInfo(sample.name + ".png")
+        info.size = len(sample.png)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(sample.png))
+
+        image_id = len(self._images)
+        width, height = sample.img_size
+        self._images.append({'id': image_id,
+                             'file_name': sample.name + ".png",
+                             'width': width,
+                             'height': height})
+        for annot in COCO_annotations(sample.node_bboxes, sample.edge_bboxes):
+            annot['id'] = len(self._annotations)
+            annot['image_id'] = image_id
+            self._annotations.append(annot)
+
+        labels = sample.graph.labels.tolist()
+        self._edges.extend((labels[node_1], labels[node_2], edge_type) for (node_1, node_2), edge_type
+                           in zip(sample.graph.edges.tolist(), sample.graph.types.tolist()))
+        self._image_ptr.append(len(self._edges))
+
+        if len(self._images) >= self.samples_per_shard:
+            self._close_shard()
+            self._open_shard()
+
+    def _close_shard(self) -> None:
+        self._tar.close()
+        self._file.close()
+
+        shard_prefix = self.prefix + f"shard_{len(self.shards):05d}"
+        coco = {'format_version': ANNOTATION_FORMAT_VERSION,
+                'images': self._images,
+                'annotations': self._annotations,
+                'categories': [{'id': category.value, 'name': category.name} for category in CategoryId]}
+        with open(shard_prefix + ".json", "w") as fp:
+            json.dump(coco, fp)
+
+        src, dst, types = zip(*self._edges) if self._edges else ((), (), ())
+        np.savez(shard_prefix + "_adj.npz",
+                 image_ptr=np.array(self._image_ptr, dtype=np.int64),
+                 src=np.array(src, dtype="<U2"),
+                 dst=np.array(dst, dtype="<U2"),
+                 type=np.array(types, dtype=np.uint8))
+
+        self.shards.append({'name': self.shard_name,
+                            'samples': [image['file_name'][:-len(".png")] for image in self._images]})
+        self._write_index()
+
+    def _write_index(self) -> None:
+        tmp_path = self.prefix + "index.json.tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({'samples_per_shard': self.samples_per_shard, 'shards': self.shards}, fp)
+        os.replace(tmp_path, self.prefix + "index.json")
+
+    def close(self) -> None:
+        """
+        Closes the last shard, an empty one is removed.
+        """
+        if self._images:
+            self._close_shard()
+        else:
+            self._tar.close()
+            self._file.close()
+            os.remove(self.prefix + f"shard_{len(self.shards):05d}.tar")
+            self._write_index()
+
+    def __enter__(self) -> 'ShardWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,208 @@
+"""
+Builds the adjacency list of a graph from its node and edge bboxes.
+
+Usage (validation against the checked-in samples, from the repository root):
+    python -m src.intelligent_graph_recognizer_lib.assembler [data]
+"""
+from src.intelligent_graph_recognizer_lib.matching import match_nodes
+from src.data_generator.util import CategoryId, grid_sort, grid_candidates
+from typing import Optional, Union, Tuple
+import numpy as np
+import argparse
+import pickle
+import glob
+import json
+import os
+
+# Categories of edges in the json written before annotations.COCO_annotations kept
+# the edge type as it is: type 1 was annotated as EDGE_TYPE_1 (2), type 2 as EDGE_TYPE_2 (1).
+# Such a json has no "format_version" (see annotations.ANNOTATION_FORMAT_VERSION).
+LEGACY_EDGE_TYPES = {CategoryId.EDGE_TYPE_1: 1, CategoryId.EDGE_TYPE_2: 2}
+
+
+class NodeGrid:
+    """
+    Uniform grid over node centers (see util.grid_sort), as osm_index.SpatialIndex is over OSM nodes:
+    the nodes around a point are found by binary searches over the 3x3 cells around it
+    instead of among all nodes.
+    """
+
+    def __init__(self, centers: np.ndarray, cell_size: float):
+        """
+        :param centers: (N, 2) array of x, y of the node centers;
+        :param cell_size: side of a cell in pixels, the farthest distance nearest looks at.
+        """
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        self.cell_size = max(float(cell_size), 1.0)
+        self.origin = self.centers.min(axis=0) if len(self.centers) else np.zeros(2)
+
+        self.order, self.keys, self.n_cols = grid_sort(*self._cells(self.centers))
+
+    def _cells(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        cells = np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+        return cells[:, 1], cells[:, 0]
+
+    def nearest(self, points: np.ndarray, max_distance: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param points: (M, 2) array of x, y;
+        :param max_distance: nodes farther than that aren't taken, at most cell_size.
+        :return: (M,) array of the numbers of the nearest nodes, -1 if there is none close enough,
+                 + (M,) array of the distances to them, inf if there is none.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        query_ids, nodes = grid_candidates(self.order, self.keys, self.n_cols, *self._cells(points), reach=1)
+
+        distances = np.linalg.norm(self.centers[nodes] - points[query_ids], axis=1)
+        close = distances <= max_distance
+        query_ids, nodes, distances = query_ids[close], nodes[close], distances[close]
+
+        # the closest candidate of every point comes first in its group
+        order = np.lexsort((distances, query_ids))
+        query_ids, nodes, distances = query_ids[order], nodes[order], distances[order]
+        first = np.ones(len(query_ids), dtype=bool)
+        first[1:] = query_ids[1:] != query_ids[:-1]
+
+        nearest = np.full(len(points), -1, dtype=np.int64)
+        nearest_distance = np.full(len(points), np.inf)
+        nearest[query_ids[first]] = nodes[first]
+        nearest_distance[query_ids[first]] = distances[first]
+        return nearest, nearest_distance
+
+
+def box_centers(boxes: np.ndarray) -> np.ndarray:
+    """
+    :param boxes: (K, 4) array of x1, y1, x2, y2, corners may come in any order.
+    :return: (K, 2) float array of x, y of the box centers.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+
+
+def edge_endpoints(edge_boxes: np.ndarray, grid: NodeGrid, max_distance: float) -> np.ndarray:
+    """
+    Finds the nodes every edge connects: the connected nodes lie on one of the diagonals
+    of the edge bbox, at its corners (see plan.md). A diagonal fits if both its corners
+    have a node within max_distance and these nodes differ, the one with the closer nodes is taken.
+
+    :param edge_boxes: (E, 4) array of x1, y1, x2, y2, corners may come in any order,
+                       ex.: normalized by a detector;
+    :param grid: grid over the node centers;
+    :param max_distance: how far from a corner the center of its node may be, in pixels.
+    :return: (E, 2) array of node numbers, -1 for edges no diagonal fits.
+    """
+    edge_boxes = np.asarray(edge_boxes, dtype=np.float64).reshape(-1, 4)
+    x_min = np.minimum(edge_boxes[:, 0], edge_boxes[:, 2])
+    x_max = np.maximum(edge_boxes[:, 0], edge_boxes[:, 2])
+    y_min = np.minimum(edge_boxes[:, 1], edge_boxes[:, 3])
+    y_max = np.maximum(edge_boxes[:, 1], edge_boxes[:, 3])
+
+    # corners of the main diagonal, then of the anti-diagonal: (E, 4, 2)
+    corners = np.stack([np.stack([x_min, y_min], axis=1), np.stack([x_max, y_max], axis=1),
+                        np.stack([x_min, y_max], axis=1), np.stack([x_max, y_min], axis=1)], axis=1)
+    nearest, distances = grid.nearest(corners.reshape(-1, 2), max_distance)
+    nearest, distances = nearest.reshape(-1, 4), distances.reshape(-1, 4)
+
+    def fit(nodes: np.ndarray, node_distances: np.ndarray) -> np.ndarray:
+        fits = (nodes >= 0).all(axis=1) & (nodes[:, 0] != nodes[:, 1])
+        return np.where(fits, node_distances.sum(axis=1), np.inf)
+
+    main_fit, anti_fit = fit(nearest[:, :2], distances[:, :2]), fit(nearest[:, 2:], distances[:, 2:])
+    endpoints = np.where((anti_fit < main_fit)[:, None], nearest[:, 2:], nearest[:, :2])
+    endpoints[np.isinf(np.minimum(main_fit, anti_fit))] = -1
+    return endpoints
+
+
+def assemble_adj_list(boxes: np.ndarray, categories: np.ndarray,
+                      labels: Optional[list[str]] = None,
+                      max_distance: Optional[float] = None) \
+        -> dict[str: dict[str: dict[str: Union[str, int]]]]:
+    """
+    Builds the adjacency list of a graph from its detected bboxes.
+
+    :param boxes: (K, 4) array of x1, y1, x2, y2, as in the "bbox" of COCO_annotations;
+    :param categories: (K,) array of CategoryId values of the boxes;
+    :param labels: labels of the node boxes in their order in boxes,
+                   nodes are named by their number if not given;
+    :param max_distance: how far from a corner of an edge bbox the center of its node may be,
+                         in pixels, by default the median side of a node bbox.
+    :return: adjacency-list represented graph, as create_adj_list makes it,
+             ex.: {'R2': {'D2': {'weight': '1', 'type': 2}, ...}, ...}.
+             Edges whose nodes aren't found are left out.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    categories = np.asarray(categories).reshape(-1)
+
+    is_node = categories == CategoryId.NODE
+    node_boxes = boxes[is_node]
+    if labels is None:
+        labels = [str(num) for num in range(len(node_boxes))]
+    if max_distance is None:
+        sides = np.maximum(np.abs(node_boxes[:, 2] - node_boxes[:, 0]),
+                           np.abs(node_boxes[:, 3] - node_boxes[:, 1]))
+        max_distance = float(np.median(sides)) if len(sides) else 0.0
+
+    grid = NodeGrid(box_centers(node_boxes), max_distance)
+    endpoints = edge_endpoints(boxes[~is_node], grid, max_distance)
+
+    adj_list = {}
+    for (node_1, node_2), edge_type in zip(endpoints.tolist(), categories[~is_node].tolist()):
+        if node_1 < 0:
+            continue
+        name_1, name_2 = labels[node_1], labels[node_2]
+        adj_list.setdefault(name_1, {})[name_2] = {"type": edge_type, "weight": "1"}
+        adj_list.setdefault(name_2, {})[name_1] = {"type": edge_type, "weight": "1"}
+    return adj_list
+
+
+def read_annotations(json_path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param json_path: COCO json of a sample (see annotations.COCO_annotate_image),
+                      edge categories of a json without "format_version" are taken as LEGACY_EDGE_TYPES,
+                      ex.: the samples in data/.
+    :return: (K, 4) array of x1, y1, x2, y2 + (K,) array of CategoryId values.
+    """
+    with open(json_path) as fp:
+        coco = json.load(fp)
+    annotations = coco["annotations"]
+    boxes = np.array([annot["bbox"] for annot in annotations], dtype=np.float64).reshape(-1, 4)
+    categories = [annot["category_id"] for annot in annotations]
+    if "format_version" not in coco:
+        categories = [LEGACY_EDGE_TYPES.get(category, category) for category in categories]
+    return boxes, np.array(categories, dtype=np.int64)
+
+
+def assemble_annotated(json_path: str) -> dict[str: dict[str: dict[str: Union[str, int]]]]:
+    """
+    :param json_path: COCO json of a sample (see annotations.COCO_annotate_image).
+    :return: adjacency list assembled from the annotated bboxes, nodes are named by their number.
+    """
+    return assemble_adj_list(*read_annotations(json_path))
+
+
+def validate(samples_dir: str) -> dict[str: bool]:
+    """
+    Assembles every sample from its json and compares it with its _src_dict.pickle:
+    the graphs must be the same up to node names, which only a label reader can recover.
+
+    :param samples_dir: directory with <name>.json and <name>_src_dict.pickle samples.
+    :return: sample name -> whether or not the assembled graph matches the pickled one.
+    """
+    results = {}
+    for pickle_path in sorted(glob.glob(os.path.join(samples_dir, "*_src_dict.pickle"))):
+        name = os.path.basename(pickle_path)[:-len("_src_dict.pickle")]
+        with open(pickle_path, "rb") as handle:
+            truth = pickle.load(handle)
+        assembled = assemble_annotated(os.path.join(samples_dir, name + ".json"))
+        results[name] = match_nodes(assembled, truth) is not None
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("samples_dir", nargs="?", default="data")
+    args = parser.parse_args()
+
+    results = validate(args.samples_dir)
+    for name, matches in results.items():
+        print(f"{name}: {'ok' if matches else 'MISMATCH'}")
+    print(f"{sum(results.values())} of {len(results)} samples match")
@@ -0,0 +1,343 @@
+"""
+Checks recognized graphs against the ground truth the generator pickles for the Checker
+(see annotations.data_to_pickle): edge precision and recall, edge type accuracy, label accuracy.
+
+All the ground truth is loaded once into an EdgeTable - flat columns of label codes with
+per-image offsets - which can be saved and memory-mapped, and all the predictions are
+compared with it at once.
+
+Usage (from the repository root):
+    python -m src.intelligent_graph_recognizer_lib.checker <samples_dir> [<predictions_dir>]
+           [--models <module>:<loader>] [--workers 4] [--output report.json]
+Predictions are <name>.pickle adjacency lists, if they aren't given,
+the pngs of samples_dir are recognized (see recognize_graphs) with the models of the loader,
+ex.: src.intelligent_graph_recognizer_lib.intelligent_graph_recognizer:load_oracle_models
+(a test double reading the ground truth).
+"""
+from src.intelligent_graph_recognizer_lib.intelligent_graph_recognizer import recognize_graphs, Models
+from src.data_generator.osm_cache import save_arrays, load_arrays
+from typing import Callable, Iterable, NamedTuple, Optional, Union, Tuple
+from multiprocessing import Pool
+import numpy as np
+import importlib
+import argparse
+import string
+import pickle
+import glob
+import json
+import time
+import os
+
+# Labels are a capital latin letter and a digit, ex.: "A7", label codes are 0..259.
+LABEL_CODES = {letter + digit: num
+               for num, (letter, digit) in enumerate((letter, digit)
+                                                     for letter in string.ascii_uppercase
+                                                     for digit in string.digits)}
+# Labels that aren't valid, ex.: nodes named by their number, get codes from N_LABELS on,
+# one per name within an image: they never match a valid label of the ground truth, but stay distinct nodes.
+N_LABELS = len(LABEL_CODES)
+# Pickles an EdgeTable worker loads at once.
+PICKLES_PER_TASK = 256
+
+
+def adj_list_columns(graph_adj_list: dict[str: dict[str: dict[str: Union[str, int]]]]) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :param graph_adj_list: adjacency-list represented graph, an edge may be listed
+                           in one direction or in both.
+    :return: label codes of the nodes + label codes of the lesser and the greater node of
+             every undirected edge, each edge once, + edge types.
+    """
+    unknown = {}  # label that isn't valid -> its code in this image
+
+    def code(label: str) -> int:
+        known = LABEL_CODES.get(label)
+        return known if known is not None else unknown.setdefault(label, N_LABELS + len(unknown))
+
+    nodes, edges = set(), {}
+    for node_1, node_adj_list in graph_adj_list.items():
+        code_1 = code(node_1)
+        nodes.add(code_1)
+        for node_2, info in node_adj_list.items():
+            code_2 = code(node_2)
+            nodes.add(code_2)
+            edges.setdefault((min(code_1, code_2), max(code_1, code_2)), int(info["type"]))
+
+    pairs = np.array(list(edges.keys()), dtype=np.int32).reshape(-1, 2)
+    return np.array(sorted(nodes), dtype=np.int32), pairs[:, 0], pairs[:, 1], \
+        np.array(list(edges.values()), dtype=np.uint8)
+
+
+def _load_pickles(paths: list[str]) -> list[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    columns = []
+    for path in paths:
+        with open(path, "rb") as handle:
+            columns.append(adj_list_columns(pickle.load(handle)))
+    return columns
+
+
+class EdgeTable:
+    """
+    Adjacency lists of many images in flat columns:
+    nodes of the i-th image are nodes[node_ptr[i]:node_ptr[i + 1]],
+    its edges are lo/hi/type[edge_ptr[i]:edge_ptr[i + 1]], every undirected edge once,
+    nodes are label codes (see LABEL_CODES and adj_list_columns).
+    """
+    _arrays = ("node_ptr", "nodes", "edge_ptr", "lo", "hi", "type")
+
+    def __init__(self, names: list[str],
+                 columns: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]):
+        """
+        :param names: names of the images, ex.: "graph_20221122_022933_1186";
+        :param columns: adj_list_columns of every image, aligned with names.
+        """
+        self.names = list(names)
+        nodes, lo, hi, types = zip(*columns) if self.names else ((), (), (), ())
+        self.node_ptr = np.zeros(len(self.names) + 1, dtype=np.int64)
+        self.node_ptr[1:] = np.cumsum([len(image_nodes) for image_nodes in nodes])
+        self.edge_ptr = np.zeros(len(self.names) + 1, dtype=np.int64)
+        self.edge_ptr[1:] = np.cumsum([len(image_lo) for image_lo in lo])
+        self.nodes = np.concatenate(nodes) if nodes else np.zeros(0, dtype=np.int32)
+        self.lo = np.concatenate(lo) if lo else np.zeros(0, dtype=np.int32)
+        self.hi = np.concatenate(hi) if hi else np.zeros(0, dtype=np.int32)
+        self.type = np.concatenate(types) if types else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_adj_lists(cls, adj_lists: Iterable[Tuple[str, dict]]) -> 'EdgeTable':
+        """
+        :param adj_lists: name of the image + its adjacency list, ex.: recognized ones.
+        :return: table of all the adjacency lists.
+        """
+        names, columns = [], []
+        for name, adj_list in adj_lists:
+            names.append(name)
+            columns.append(adj_list_columns(adj_list))
+        return cls(names, columns)
+
+    @classmethod
+    def from_pickles(cls, samples_dir: str, suffix: str = "_src_dict.pickle", workers: int = 1) \
+            -> 'EdgeTable':
+        """
+        :param samples_dir: directory with pickled adjacency lists;
+        :param suffix: the file names are <name><suffix>;
+        :param workers: number of processes unpickling the files.
+        :return: table of all the pickled adjacency lists, sorted by name.
+        """
+        paths = sorted(glob.glob(os.path.join(glob.escape(samples_dir), "*" + suffix)))
+        tasks = [paths[start:start + PICKLES_PER_TASK] for start in range(0, len(paths), PICKLES_PER_TASK)]
+        if workers > 1:
+            with Pool(workers) as pool:
+                loaded = pool.map(_load_pickles, tasks)
+        else:
+            loaded = map(_load_pickles, tasks)
+        columns = [image_columns for task_columns in loaded for image_columns in task_columns]
+        return cls([os.path.basename(path)[:-len(suffix)] for path in paths], columns)
+
+    @classmethod
+    def from_shards(cls, prefix: str) -> 'EdgeTable':
+        """
+        :param prefix: path prefix of the shards (see writers.ShardWriter).
+        :return: table of the adjacency lists of all the shards.
+        """
+        with open(prefix + "index.json") as fp:
+            shards = json.load(fp)["shards"]
+        names, columns = [], []
+        for shard in shards:
+            names.extend(shard["samples"])
+            with np.load(os.path.join(os.path.dirname(prefix), shard["name"] + "_adj.npz")) as adj:
+                image_ptr, src, dst, types = adj["image_ptr"], adj["src"], adj["dst"], adj["type"]
+            for start, end in zip(image_ptr[:-1].tolist(), image_ptr[1:].tolist()):
+                adj_list = {}
+                for node_1, node_2, edge_type in zip(src[start:end].tolist(), dst[start:end].tolist(),
+                                                     types[start:end].tolist()):
+                    adj_list.setdefault(node_1, {})[node_2] = {"type": edge_type, "weight": "1"}
+                columns.append(adj_list_columns(adj_list))
+        return cls(names, columns)
+
+    def save(self, path: str) -> None:
+        """
+        :param path: directory to write the table to (see osm_cache.save_arrays),
+                     the image names are kept in its meta.json.
+        """
+        save_arrays(path, {name: getattr(self, name) for name in self._arrays}, meta={"names": self.names})
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = "r") -> 'EdgeTable':
+        """
+        :param path: directory the table was saved to;
+        :param mmap_mode: np.load memory-map mode, by default the columns are mapped read-only.
+        :return: the table backed by (memory-mapped) arrays.
+        """
+        table = cls.__new__(cls)
+        arrays, meta = load_arrays(path, cls._arrays, mmap_mode)
+        for name, array in zip(cls._arrays, arrays):
+            setattr(table, name, array)
+        table.names = meta["names"]
+        return table
+
+    def image_ids(self, ptr: np.ndarray) -> np.ndarray:
+        """
+        :param ptr: node_ptr or edge_ptr.
+        :return: number of the image of every node or edge.
+        """
+        return np.repeat(np.arange(len(self.names)), np.diff(ptr))
+
+
+class Report(NamedTuple):
+    """
+    Scores of the predictions, per image and over all the edges and nodes,
+    a score is None if there is nothing to compute it over, ex.: recall of an image without edges.
+    """
+    images: dict[str: dict[str: Optional[float]]]
+    total: dict[str: Optional[float]]
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """
+    :return: numerator / denominator, NaN where the denominator is 0.
+    """
+    numerator, denominator = np.asarray(numerator, dtype=np.float64), np.asarray(denominator)
+    return np.divide(numerator, denominator, out=np.full_like(numerator, np.nan), where=denominator > 0)
+
+
+def _score(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def _scores(edges: np.ndarray, predicted: np.ndarray, true_positive: np.ndarray, same_type: np.ndarray,
+            nodes: np.ndarray, recognized_nodes: np.ndarray) -> dict[str: np.ndarray]:
+    return {"edge_precision": _ratio(true_positive, predicted),
+            "edge_recall": _ratio(true_positive, edges),
+            "edge_type_accuracy": _ratio(same_type, true_positive),
+            "label_accuracy": _ratio(recognized_nodes, nodes)}
+
+
+def compare(truth: EdgeTable, predictions: EdgeTable) -> Report:
+    """
+    Compares all the predictions with the ground truth at once.
+    Edges are matched by the labels of their nodes, so an edge between wrongly read labels
+    is both a false positive and a false negative.
+
+    :param truth: ground truth, ex.: EdgeTable.from_pickles(samples_dir);
+    :param predictions: recognized graphs, images are matched with the ground truth by name,
+                        images without a prediction count as recognized empty.
+    :return: edge precision, edge recall, edge type accuracy (among the matched edges) and
+             label accuracy (share of the true labels that are recognized) of every image
+             and over all of them, None where there is nothing to compute a score over.
+    """
+    image_num = {name: num for num, name in enumerate(truth.names)}
+    unknown = [name for name in predictions.names if name not in image_num]
+    if unknown:
+        raise ValueError(f"{len(unknown)} predictions have no ground truth, ex.: {unknown[0]}.")
+    predicted_image = np.array([image_num[name] for name in predictions.names], dtype=np.int64)
+    n_images = len(truth)
+
+    # an edge is keyed by its image and both its label codes, a node by its image and label code
+    key_base = max(int(np.max(table.nodes, initial=N_LABELS - 1)) for table in (truth, predictions)) + 1
+
+    def edge_keys(table: EdgeTable, images: np.ndarray) -> np.ndarray:
+        return (images[table.image_ids(table.edge_ptr)] * key_base + table.lo) * key_base + table.hi
+
+    def node_keys(table: EdgeTable, images: np.ndarray) -> np.ndarray:
+        return images[table.image_ids(table.node_ptr)] * key_base + table.nodes
+
+    true_edges = edge_keys(truth, np.arange(n_images))
+    order = np.argsort(true_edges, kind="stable")
+    true_edges, true_types = true_edges[order], np.asarray(truth.type)[order]
+    predicted_edges = edge_keys(predictions, predicted_image)
+
+    position = np.minimum(np.searchsorted(true_edges, predicted_edges), max(len(true_edges) - 1, 0))
+    matched = true_edges[position] == predicted_edges if len(true_edges) else \
+        np.zeros(len(predicted_edges), dtype=bool)
+    same_type = matched & (true_types[position] == np.asarray(predictions.type)) if len(true_edges) else matched
+
+    edge_image = predicted_image[predictions.image_ids(predictions.edge_ptr)]
+    recognized_nodes = np.isin(node_keys(truth, np.arange(n_images)), node_keys(predictions, predicted_image))
+
+    counts = {"edges": np.diff(truth.edge_ptr),
+              "predicted": np.bincount(edge_image, minlength=n_images),
+              "true_positive": np.bincount(edge_image[matched], minlength=n_images),
+              "same_type": np.bincount(edge_image[same_type], minlength=n_images),
+              "nodes": np.diff(truth.node_ptr),
+              "recognized_nodes": np.bincount(truth.image_ids(truth.node_ptr)[recognized_nodes],
+                                              minlength=n_images)}
+
+    per_image = _scores(*counts.values())
+    images = {name: {score: _score(values[num]) for score, values in per_image.items()}
+              for num, name in enumerate(truth.names)}
+    total = {score: _score(value) for score, value in
+             _scores(*(np.array(count.sum()) for count in counts.values())).items()}
+    total.update({"images": n_images, "edges": int(counts["edges"].sum()),
+                  "predicted_edges": int(counts["predicted"].sum())})
+    return Report(images, total)
+
+
+def check_predictions(samples_dir: str, predictions_dir: str, workers: int = 1) -> Report:
+    """
+    :param samples_dir: directory with the <name>_src_dict.pickle ground truth;
+    :param predictions_dir: directory with the <name>.pickle recognized adjacency lists;
+    :param workers: number of processes unpickling the files.
+    :return: scores, the images per second of the comparison are in total["images_per_s"].
+    """
+    truth = EdgeTable.from_pickles(samples_dir, workers=workers)
+    predictions = EdgeTable.from_pickles(predictions_dir, suffix=".pickle", workers=workers)
+    start = time.perf_counter()
+    report = compare(truth, predictions)
+    report.total["images_per_s"] = len(truth) / max(time.perf_counter() - start, 1e-9)
+    return report
+
+
+def check_recognizer(samples_dir: str, load_models: Callable[[], Models], workers: int = 1) -> Report:
+    """
+    Recognizes the pngs of the samples (see recognize_graphs) and checks the results.
+
+    :param samples_dir: directory with <name>.png and <name>_src_dict.pickle samples;
+    :param load_models: picklable (ex.: module-level) function returning the models;
+    :param workers: number of processes loading the ground truth and recognizing the images.
+    :return: scores, the images per second of recognition and comparison together
+             are in total["images_per_s"].
+    """
+    truth = EdgeTable.from_pickles(samples_dir, workers=workers)
+    start = time.perf_counter()
+    paths = [os.path.join(samples_dir, name + ".png") for name in truth.names]
+    recognized = ((os.path.basename(result.path)[:-len(".png")], result.graph_adj_list or {})
+                  for result in recognize_graphs(paths, load_models, workers))
+    report = compare(truth, EdgeTable.from_adj_lists(recognized))
+    report.total["images_per_s"] = len(truth) / max(time.perf_counter() - start, 1e-9)
+    return report
+
+
+def import_loader(spec: str) -> Callable[[], Models]:
+    """
+    :param spec: <module>:<function>, ex.: "<package>.intelligent_graph_recognizer:load_oracle_models".
+    :return: the model loader.
+    """
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("samples_dir", help="directory with the _src_dict.pickle ground truth")
+    parser.add_argument("predictions_dir", nargs="?", help="directory with the <name>.pickle predictions")
+    parser.add_argument("--models", help="<module>:<loader> of the models recognizing the pngs, "
+                                         "required if there are no predictions")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="json to write the per-image and total scores to")
+    args = parser.parse_args()
+
+    if args.predictions_dir is not None:
+        report = check_predictions(args.samples_dir, args.predictions_dir, args.workers)
+    elif args.models is not None:
+        report = check_recognizer(args.samples_dir, import_loader(args.models), args.workers)
+    else:
+        parser.error("either predictions_dir or --models is required")
+
+    for score, value in report.total.items():
+        print(f"{score}: {value:.4f}" if isinstance(value, float) else f"{score}: {value}")
+    if args.output is not None:
+        with open(args.output, "w") as fp:
+            json.dump(report._asdict(), fp, indent=2)
@@ -0,0 +1,194 @@
+"""
+Entry points of the Intelligent Graph Recognizer:
+recognize_graph(path, load_models) for one image and recognize_graphs(paths, load_models, workers) for batches.
+
+Recognition is split into stages: decode the image, detect node and edge bboxes,
+read the node labels, assemble the adjacency list (see assembler.assemble_adj_list).
+The detector and the label reader are loaded once per worker process by a model loader.
+There is no trained one yet: load_oracle_models is a test double that reads the ground truth,
+it only exercises the pipeline, its scores say nothing about recognition.
+"""
+from src.intelligent_graph_recognizer_lib.assembler import assemble_adj_list, read_annotations
+from src.data_generator.util import CategoryId
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
+from multiprocessing import Pool
+from itertools import islice
+import numpy as np
+import time
+import cv2
+import os
+
+# Images a worker gets at once, the next image is decoded while the current one is recognized.
+BATCH_SIZE = 16
+
+# detector(image, path) -> (K, 4) array of x1, y1, x2, y2 + (K,) array of CategoryId values
+Detector = Callable[[np.ndarray, str], Tuple[np.ndarray, np.ndarray]]
+# label_reader(image, node_boxes) -> labels of the node boxes, ex.: ["R2", "D2"]
+LabelReader = Callable[[np.ndarray, np.ndarray], list[str]]
+
+# Models of the worker process, loaded once by its initializer, and their loader.
+_worker_state = {}
+
+
+class Models(NamedTuple):
+    """
+    Everything recognition needs besides the image.
+    """
+    detector: Detector
+    label_reader: Optional[LabelReader]  # nodes are named by their number if there is none
+
+
+class Recognition(NamedTuple):
+    """
+    Result of recognize_graphs for one image.
+    """
+    path: str
+    graph_adj_list: Optional[dict]  # as recognize_graph returns it, None on error
+    timings: dict[str: float]  # stage -> seconds, "total" - all of them
+    error: Optional[str] = None
+
+
+def oracle_detector(image: np.ndarray, path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Test double of a detector: takes the ground truth bboxes from the COCO json
+    written next to the png by src/data_generator (see annotations.COCO_annotate_image).
+
+    :param image: decoded image, not used;
+    :param path: path to the png.
+    :return: (K, 4) array of x1, y1, x2, y2 + (K,) array of CategoryId values.
+    """
+    return read_annotations(os.path.splitext(path)[0] + ".json")
+
+
+def load_oracle_models() -> Models:
+    """
+    Test double of a model loader, never use it to score recognition.
+
+    :return: models that read the ground truth annotations instead of the image,
+             to run the pipeline end to end before a detector is trained.
+    """
+    return Models(oracle_detector, None)
+
+
+def _init_worker(load_models: Callable[[], Models]) -> None:
+    """
+    Worker process initializer: loads the models once, they are never pickled into tasks.
+    In the main process the models are kept between calls with the same loader.
+
+    :param load_models: picklable (ex.: module-level) function returning the models.
+    """
+    if _worker_state.get("load_models") is not load_models:
+        _worker_state["models"] = load_models()
+        _worker_state["load_models"] = load_models
+
+
+def decode_image(path: str) -> np.ndarray:
+    """
+    :param path: path to a png or jpg.
+    :return: BGR image.
+    """
+    image = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Can't decode {path}.")
+    return image
+
+
+def _timed_decode(path: str) -> Tuple[Optional[np.ndarray], float, Optional[str]]:
+    start = time.perf_counter()
+    try:
+        image, error = decode_image(path), None
+    except (OSError, ValueError) as e:
+        image, error = None, f"{type(e).__name__}: {e}"
+    return image, time.perf_counter() - start, error
+
+
+def _recognize(models: Models, path: str, image: np.ndarray, timings: dict[str: float]) \
+        -> dict[str: dict[str: dict[str: Union[str, int]]]]:
+    """
+    Runs the stages after decoding, their times are added to timings.
+    """
+    start = time.perf_counter()
+    boxes, categories = models.detector(image, path)
+    timings["detect"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    labels = models.label_reader(image, boxes[categories == CategoryId.NODE]) \
+        if models.label_reader is not None else None
+    timings["labels"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    adj_list = assemble_adj_list(boxes, categories, labels)
+    timings["assemble"] = time.perf_counter() - start
+    return adj_list
+
+
+def _recognize_batch(paths: list[str]) -> list[Recognition]:
+    """
+    Recognizes images with the models of the worker,
+    a thread decodes the next image meanwhile (OpenCV releases the GIL).
+    """
+    models = _worker_state["models"]
+    results = []
+    with ThreadPoolExecutor(1) as decoder:
+        decoded = decoder.map(_timed_decode, paths)
+        for path, (image, decode_s, error) in zip(paths, decoded):
+            timings = {"decode": decode_s}
+            adj_list = None
+            if error is None:
+                try:
+                    adj_list = _recognize(models, path, image, timings)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+            timings["total"] = sum(timings.values())
+            results.append(Recognition(path, adj_list, timings, error))
+    return results
+
+
+def _batches(paths: Iterable[str], batch_size: int) -> Iterator[list[str]]:
+    paths = iter(paths)
+    while batch := list(islice(paths, batch_size)):
+        yield batch
+
+
+def recognize_graphs(paths: Iterable[Union[str, os.PathLike]],
+                     load_models: Callable[[], Models],
+                     workers: int = 1,
+                     batch_size: int = BATCH_SIZE) -> Iterator[Recognition]:
+    """
+    Recognizes many images, models are loaded once per worker process.
+
+    :param paths: paths to pngs or jpgs, may be a lazy iterable;
+    :param load_models: picklable (ex.: module-level) function returning the models,
+                        it is called once in every worker;
+    :param workers: number of worker processes;
+    :param batch_size: images a worker gets at once.
+    :return: results in the order of paths, as soon as they are ready.
+             An image that fails doesn't stop the others, its error is in the result.
+    """
+    batches = _batches((os.fspath(path) for path in paths), batch_size)
+
+    if workers > 1:
+        with Pool(workers, initializer=_init_worker, initargs=(load_models,)) as pool:
+            for results in pool.imap(_recognize_batch, batches):
+                yield from results
+    else:
+        _init_worker(load_models)
+        for batch in batches:
+            yield from _recognize_batch(batch)
+
+
+def recognize_graph(path: Union[str, os.PathLike], load_models: Callable[[], Models]) \
+        -> dict[str: dict[str: dict[str: Union[str, int]]]]:
+    """
+    Recognizes one image, the models are loaded by the first call only.
+
+    :param path: path to a png or jpg on the local computer;
+    :param load_models: function returning the models.
+    :return: adjacency-list represented graph,
+             ex.: {'R2': {'D2': {'weight': '1', 'type': 2}, ...}, ...}.
+             Weight isn't used and is always '1'.
+    """
+    _init_worker(load_models)
+    path = os.fspath(path)
+    return _recognize(_worker_state["models"], path, decode_image(path), {})
@@ -0,0 +1,93 @@
+from collections import Counter, deque
+from typing import Optional, Union
+
+
+def typed_edges(graph_adj_list: dict[str: dict[str: dict[str: Union[str, int]]]]) \
+        -> dict[frozenset: int]:
+    """
+    :param graph_adj_list: adjacency-list represented graph, an edge may be listed
+                           in one direction or in both.
+    :return: every undirected edge once: {node_1, node_2} -> edge type.
+    """
+    edges = {}
+    for node_1, node_adj_list in graph_adj_list.items():
+        for node_2, info in node_adj_list.items():
+            edges.setdefault(frozenset((node_1, node_2)), int(info["type"]))
+    return edges
+
+
+def _neighbours(edges: dict[frozenset: int]) -> dict[str: dict[str: int]]:
+    neighbours = {}
+    for edge, edge_type in edges.items():
+        node_1, node_2 = tuple(edge) if len(edge) == 2 else (*edge, *edge)
+        neighbours.setdefault(node_1, {})[node_2] = edge_type
+        neighbours.setdefault(node_2, {})[node_1] = edge_type
+    return neighbours
+
+
+def match_nodes(graph_adj_list: dict[str: dict[str: dict[str: Union[str, int]]]],
+                other_adj_list: dict[str: dict[str: dict[str: Union[str, int]]]]) \
+        -> Optional[dict]:
+    """
+    Finds how the nodes of one graph map to the nodes of the other one,
+    so that edges and their types are the same, whatever the node names are.
+    It lets a graph be checked before node labels can be read, ex.: recognized with numbered nodes.
+
+    :param graph_adj_list: adjacency-list represented graph;
+    :param other_adj_list: adjacency-list represented graph.
+    :return: node name of the graph -> node name of the other one, None if the graphs differ.
+    """
+    edges, other_edges = typed_edges(graph_adj_list), typed_edges(other_adj_list)
+    if len(edges) != len(other_edges) or \
+            sorted(edges.values()) != sorted(other_edges.values()):
+        return None
+    neighbours, other_neighbours = _neighbours(edges), _neighbours(other_edges)
+    if len(neighbours) != len(other_neighbours):
+        return None
+
+    # nodes can only be mapped to nodes with the same edge types around them
+    def signature(node_neighbours: dict[str: int]) -> tuple:
+        return tuple(sorted(Counter(node_neighbours.values()).items()))
+
+    candidates = {}
+    for node, node_neighbours in other_neighbours.items():
+        candidates.setdefault(signature(node_neighbours), []).append(node)
+
+    # nodes are mapped neighbours first, so that a wrong choice fails early
+    order, seen = [], set()
+    for start in sorted(neighbours, key=lambda node: -len(neighbours[node])):
+        if start in seen:
+            continue
+        order.append(start)
+        seen.add(start)
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for neighbour in sorted(neighbours[node], key=lambda n: -len(neighbours[n])):
+                if neighbour not in seen:
+                    order.append(neighbour)
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+
+    mapping, used = {}, set()
+
+    def extend(position: int) -> bool:
+        if position == len(order):
+            return True
+        node = order[position]
+        for other in candidates.get(signature(neighbours[node]), ()):
+            if other in used:
+                continue
+            # every edge to an already mapped node must be there, with the same type
+            if any(other_neighbours[other].get(mapping[neighbour]) != edge_type
+                   for neighbour, edge_type in neighbours[node].items() if neighbour in mapping):
+                continue
+            mapping[node] = other
+            used.add(other)
+            if extend(position + 1):
+                return True
+            del mapping[node]
+            used.discard(other)
+        return False
+
+    return dict(mapping) if extend(0) else None
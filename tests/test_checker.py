@@ -0,0 +1,55 @@
+from src.intelligent_graph_recognizer_lib.checker import EdgeTable, compare
+import numpy as np
+import pytest
+
+
+def edge(edge_type: int) -> dict:
+    return {"type": edge_type, "weight": "1"}
+
+
+TRUTH = {"A1": {"B2": edge(1), "C3": edge(2)}, "B2": {"C3": edge(1)}}
+
+
+def test_unknown_labels_stay_distinct_nodes():
+    # labels aren't read, the nodes are numbered: three distinct edges, none of them matches
+    predicted = {"0": {"1": edge(1), "2": edge(2)}, "1": {"2": edge(1)}}
+    report = compare(EdgeTable.from_adj_lists([("image", TRUTH)]),
+                     EdgeTable.from_adj_lists([("image", predicted)]))
+
+    assert report.total["predicted_edges"] == 3
+    assert report.total["edge_precision"] == 0.0
+    assert report.total["edge_recall"] == 0.0
+
+
+def test_unknown_label_doesnt_hide_known_edges():
+    predicted = {"A1": {"B2": edge(1), "x": edge(2)}, "B2": {"y": edge(1)}}
+    report = compare(EdgeTable.from_adj_lists([("image", TRUTH)]),
+                     EdgeTable.from_adj_lists([("image", predicted)]))
+
+    assert report.total["edge_precision"] == pytest.approx(1 / 3)
+    assert report.total["edge_recall"] == pytest.approx(1 / 3)
+    assert report.total["label_accuracy"] == pytest.approx(2 / 3)
+
+
+def test_scores_without_denominator_are_none():
+    truth = EdgeTable.from_adj_lists([("image", TRUTH), ("empty", {})])
+    report = compare(truth, EdgeTable.from_adj_lists([("image", {})]))
+
+    assert report.images["image"]["edge_recall"] == 0.0
+    assert report.images["image"]["edge_precision"] is None
+    assert report.images["image"]["edge_type_accuracy"] is None
+    assert report.images["empty"]["edge_recall"] is None
+    assert report.images["empty"]["label_accuracy"] is None
+    assert report.total["edge_precision"] is None
+
+
+def test_table_is_saved_and_memory_mapped(tmp_path):
+    table = EdgeTable.from_adj_lists([("image", TRUTH), ("numbered", {"0": {"1": edge(2)}})])
+    table.save(str(tmp_path / "table"))
+    loaded = EdgeTable.load(str(tmp_path / "table"))
+
+    assert loaded.names == table.names
+    for name in EdgeTable._arrays:
+        assert isinstance(getattr(loaded, name), np.memmap)
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(table, name))
+    assert compare(loaded, table).total["edge_recall"] == 1.0
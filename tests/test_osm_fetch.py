@@ -0,0 +1,52 @@
+from src.data_generator.overpass_stub import OverpassStub, BAD_RESPONSES, record_response
+from src.data_generator.osm_cache import extract_from_response_file, load_extract
+from src.data_generator.osm_fetch import TileFetcher, extract_jobs
+import numpy as np
+import requests
+import pytest
+import os
+
+FIXTURE = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "fixtures", "osm_fixture.json")
+# one tile
+BBOX = (55.75, 37.6, 55.8, 37.65)
+
+
+@pytest.fixture
+def job(tmp_path) -> tuple:
+    (path, query), = extract_jobs(bbox=BBOX, cache_dir=str(tmp_path / "osm_cache"))
+    record_response(str(tmp_path / "recorded"), query, FIXTURE)
+    return path, query
+
+
+def assert_same_extract(path: str) -> None:
+    for saved, recorded in zip(load_extract(path), extract_from_response_file(FIXTURE)):
+        np.testing.assert_array_equal(saved, recorded)
+
+
+def test_busy_answers_are_retried(job, tmp_path):
+    with OverpassStub(str(tmp_path / "recorded"), fail_first=2) as stub:
+        fetched, = TileFetcher(stub.url, max_workers=1, max_retries=2, backoff=0.01).fetch([job])
+
+    assert len(stub.requests) == 3
+    assert_same_extract(fetched)
+
+
+def test_bad_responses_are_retried(job, tmp_path):
+    bad_first = len(BAD_RESPONSES)
+    with OverpassStub(str(tmp_path / "recorded"), fail_first=1, bad_first=bad_first) as stub:
+        fetched, = TileFetcher(stub.url, max_workers=1, max_retries=bad_first + 1, backoff=0.01).fetch([job])
+
+    assert len(stub.requests) == bad_first + 2
+    assert_same_extract(fetched)
+
+
+@pytest.mark.parametrize("bad", range(len(BAD_RESPONSES)), ids=BAD_RESPONSES)
+def test_bad_response_is_not_saved(job, tmp_path, bad):
+    path, _ = job
+    # every answer is broken, the one of this kind is the last
+    with OverpassStub(str(tmp_path / "recorded"), bad_first=bad + 1) as stub:
+        with pytest.raises((requests.RequestException, ValueError)):
+            TileFetcher(stub.url, max_workers=1, max_retries=bad, backoff=0.01).fetch([job])
+
+    assert len(stub.requests) == bad + 1
+    assert not os.path.exists(path)
@@ -0,0 +1,45 @@
+from src.data_generator.visualize import draw_graph, get_pos_info
+from src.data_generator.graph import Graph
+from src.data_generator.util import png_size
+import pygraphviz as pgv
+import pytest
+import pickle
+import glob
+import os
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "data")
+
+
+def load_graphs() -> list[Graph]:
+    graphs = []
+    for path in sorted(glob.glob(os.path.join(SAMPLES_DIR, "*_src_dict.pickle"))):
+        with open(path, "rb") as handle:
+            graphs.append(Graph.from_adj_list(pickle.load(handle)))
+    return graphs
+
+
+@pytest.mark.parametrize("graph", load_graphs())
+def test_cached_layout_renders_as_fresh_one(graph, monkeypatch):
+    """
+    A render from a cached layout (see dedupe.LayoutCache) must keep the image size
+    and the node positions, bboxes are built from them.
+    """
+    draw = pgv.AGraph.draw
+    rendered = []
+
+    def draw_and_keep(dot, *args, **kwargs):
+        # what the renderer actually placed: the same graph, drawn by the same program as dot
+        placed = draw(dot, format="dot", prog=kwargs.get("prog"))
+        rendered.append(get_pos_info(pgv.AGraph(string=placed.decode())))
+        return draw(dot, *args, **kwargs)
+
+    monkeypatch.setattr(pgv.AGraph, "draw", draw_and_keep)
+    pos_info, png = draw_graph(None, graph)
+    cached_pos_info, cached_png = draw_graph(None, graph, pos_info=pos_info)
+
+    assert cached_pos_info is pos_info
+    assert png_size(cached_png) == png_size(png)
+    fresh_pos, cached_pos = rendered
+    for name, info in fresh_pos.items():
+        assert cached_pos[name] == pytest.approx(info)
+        assert pos_info[name] == pytest.approx(info)